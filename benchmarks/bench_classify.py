@@ -0,0 +1,22 @@
+from quickparse.lib import get_arg_type, classify_arg
+
+from .common import benchmark
+
+
+TOKENS = ('--', '-12', '+3', '-a', '--all', '--name=foo', '-abc', '-nFoo', 'file.txt', 'commit') * 100
+
+@benchmark('classify/get_arg_type 1k tokens')
+def setup_get_arg_type():
+    def run():
+        for token in TOKENS:
+            get_arg_type(token)
+    return run
+
+@benchmark('classify/classify_arg 1k unique tokens, no memo')
+def setup_classify_arg_uncached():
+    unique_tokens = tuple(f"{token}{index}" if token[-1].isalpha() else token for index, token in enumerate(TOKENS))
+    classify = classify_arg.__wrapped__
+    def run():
+        for token in unique_tokens:
+            classify(token)
+    return run
@@ -0,0 +1,27 @@
+from quickparse import QuickParse
+
+from .common import benchmark, to_letters
+
+
+def handler():
+    pass
+
+def get_deep_commands_config(depth = 5, aliases = 4):
+    if depth == 0:
+        return handler
+    return {tuple(f"level-{to_letters(depth)}-{to_letters(alias)}" for alias in range(aliases)): get_deep_commands_config(depth - 1, aliases)}
+
+DEEP_COMMANDS = ['level-f-a', 'level-e-b', 'level-d-c', 'level-c-d', 'level-b-a']
+
+@benchmark('commands/parse and membership test on deep alias tree')
+def setup_membership():
+    spec = QuickParse.compile(get_deep_commands_config())
+    def run():
+        parsed = spec.parse(DEEP_COMMANDS)
+        return 'level-f-d level-e-d level-d-d level-c-d level-b-d' in parsed.commands
+    return run
+
+@benchmark('commands/iterate all 1024 equivalents')
+def setup_iterate():
+    parsed = QuickParse.compile(get_deep_commands_config()).parse(DEEP_COMMANDS)
+    return lambda: tuple(parsed.commands)
@@ -0,0 +1,27 @@
+from quickparse import QuickParse, Completer
+
+from .bench_configs import get_large_commands_config, get_large_options_config
+from .common import benchmark
+
+
+def get_completer():
+    completer = Completer(QuickParse.compile(get_large_commands_config(), get_large_options_config()))
+    # the prefix indexes are built on first use
+    completer.complete(['s-ec', 'op'])
+    completer.complete(['--al'])
+    return completer
+
+@benchmark('completion/command among 10k commands')
+def setup_complete_command():
+    completer = get_completer()
+    return lambda: completer.complete(['s-ec', 'operation-'])
+
+@benchmark('completion/option among 15k option names')
+def setup_complete_option():
+    completer = get_completer()
+    return lambda: completer.complete(['s-ec', 'operation-h', '--opt-ba', 'x', '--alias-b'])
+
+@benchmark('completion/first call with 10k commands and 5k options')
+def setup_complete_first_call():
+    spec = QuickParse.compile(get_large_commands_config(), get_large_options_config())
+    return lambda: (Completer(spec).complete(['s-ec', 'op']), Completer(spec).complete(['--al']))
@@ -0,0 +1,99 @@
+import argparse
+import atexit
+import shutil
+import tempfile
+
+from quickparse import QuickParse, subcommands
+from quickparse.lib import get_commands_config_problems, get_options_config_problems
+
+from .common import benchmark, to_letters
+
+
+def handler():
+    pass
+
+def get_large_commands_config(services = 100, operations = 100):
+    """services * operations leaf commands, every one with an alias"""
+    return {
+        (f"service-{to_letters(service)}", f"s-{to_letters(service)}"): {
+            '': handler,
+            **{(f"operation-{to_letters(operation)}", f"op-{to_letters(operation)}"): handler for operation in range(operations)},
+        }
+        for service in range(services)
+    }
+
+def get_large_options_config(size = 5000):
+    options_config = list()
+    for index in range(size):
+        name = to_letters(index)
+        options_config.append((f"--opt-{name}", f"--alias-{name}", f"+{name}x", str if index % 2 == 0 else bool))
+    return options_config
+
+@benchmark('config/compile 10k commands and 5k options')
+def setup_compile():
+    commands_config = get_large_commands_config()
+    options_config = get_large_options_config()
+    return lambda: QuickParse.compile(commands_config, options_config)
+
+@benchmark('config/compile 10k commands and 5k options from cache')
+def setup_compile_from_cache():
+    commands_config = get_large_commands_config()
+    options_config = get_large_options_config()
+    cache_dir = tempfile.mkdtemp(prefix='quickparse-bench-')
+    atexit.register(shutil.rmtree, cache_dir, True)
+    QuickParse.compile(commands_config, options_config, cache_dir=cache_dir, cache_key='bench')
+    return lambda: QuickParse.compile(commands_config, options_config, cache_dir=cache_dir, cache_key='bench')
+
+@benchmark('config/parse with 10k commands and 5k options')
+def setup_parse_large_config():
+    spec = QuickParse.compile(get_large_commands_config(), get_large_options_config())
+    argv = ['s-ec', 'operation-h', '--opt-ba', 'x', '--alias-b', 'param', '-3']
+    return lambda: spec.parse(argv)
+
+@benchmark('argparse/build 1k subcommands', tracked=False)
+def setup_argparse_build():
+    def build():
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+        for service in range(10):
+            service_parser = subparsers.add_parser(f"service-{to_letters(service)}", aliases=[f"s-{to_letters(service)}"])
+            operations = service_parser.add_subparsers()
+            for operation in range(100):
+                operations.add_parser(f"operation-{to_letters(operation)}", aliases=[f"op-{to_letters(operation)}"])
+        return parser
+    return build
+
+@benchmark('config/compile 1k commands')
+def setup_compile_1k_commands():
+    commands_config = get_large_commands_config(10, 100)
+    return lambda: QuickParse.compile(commands_config)
+
+@benchmark('config/compile 1k commands from cache')
+def setup_compile_1k_commands_from_cache():
+    commands_config = get_large_commands_config(10, 100)
+    cache_dir = tempfile.mkdtemp(prefix='quickparse-bench-')
+    atexit.register(shutil.rmtree, cache_dir, True)
+    QuickParse.compile(commands_config, cache_dir=cache_dir, cache_key='bench')
+    return lambda: QuickParse.compile(commands_config, cache_dir=cache_dir, cache_key='bench')
+
+@benchmark('config/validate 100k command keys and 8k options')
+def setup_validate_large_config():
+    # 1000 services with 49 operations and an alias for each, 8k options with 3 names each
+    commands_config = get_large_commands_config(1000, 49)
+    options_config = get_large_options_config(8000)
+    return lambda: (get_commands_config_problems(commands_config), get_options_config_problems(options_config))
+
+@benchmark('config/compile and parse 10k commands')
+def setup_compile_and_parse():
+    commands_config = get_large_commands_config()
+    return lambda: QuickParse.compile(commands_config).parse(['s-ec', 'operation-h'])
+
+@benchmark('config/compile and parse 10k commands in loaded subtrees')
+def setup_compile_and_parse_subcommands():
+    # every service is a subtree loaded on demand, only the one on the command line gets built
+    def load_service_commands():
+        return {(f"operation-{to_letters(operation)}", f"op-{to_letters(operation)}"): handler for operation in range(100)}
+    def compile_and_parse():
+        commands_config = {(f"service-{to_letters(service)}", f"s-{to_letters(service)}"): subcommands(load_service_commands) for service in range(100)}
+        return QuickParse.compile(commands_config).parse(['s-ec', 'operation-h'])
+    return compile_and_parse
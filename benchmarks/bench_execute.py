@@ -0,0 +1,30 @@
+from quickparse import QuickParse
+from quickparse.lib import humblecall
+
+from .common import benchmark
+
+
+def handler(first, second = None, *, quickparse):
+    return first
+
+class Handlers(object):
+    def method(self, first, quickparse = None):
+        return first
+
+@benchmark('execute/humblecall function')
+def setup_humblecall():
+    return lambda: humblecall(handler, 1, 2, quickparse=None, extra=3)
+
+@benchmark('execute/humblecall bound method')
+def setup_humblecall_method():
+    handlers = Handlers()
+    return lambda: humblecall(handlers.method, 1, quickparse=None)
+
+@benchmark('execute/execute() with a tuple of 3 handlers')
+def setup_execute():
+    parsed = QuickParse({'run': (handler, handler, handler)}, cli_args=['run'])
+    return lambda: parsed.execute(1)
+
+@benchmark('execute/direct call for comparison', tracked=False)
+def setup_direct_call():
+    return lambda: handler(1, 2, quickparse=None)
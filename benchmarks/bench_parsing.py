@@ -0,0 +1,116 @@
+import argparse
+import atexit
+import os
+import tempfile
+
+from quickparse import QuickParse, count, cacheable
+
+from .common import benchmark
+
+
+OPTIONS_CONFIG = [
+    ('-I', '--include', str),
+    ('-v', '--verbose', count),
+    ('-n', '--name', str),
+    ('-q', '--quiet'),
+]
+
+def get_long_argv(size):
+    argv = list()
+    while len(argv) < size:
+        index = len(argv)
+        argv += [f"file{index}.txt", '-I', f"path{index}", '-v', f"other{index}.c", '--quiet']
+    return argv[:size]
+
+def get_argparse_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-I', '--include', action='append')
+    parser.add_argument('-v', '--verbose', action='count')
+    parser.add_argument('-n', '--name')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    parser.add_argument('files', nargs='*')
+    return parser
+
+def register_long_argv(size, full_only = False, argparse_full_only = False):
+    @benchmark(f"parse/{size} tokens", full_only=full_only)
+    def setup_quickparse():
+        spec = QuickParse.compile(None, OPTIONS_CONFIG)
+        argv = get_long_argv(size)
+        return lambda: spec.parse(argv)
+
+    # parse_intermixed_args is what matches quickparse, it gets slow on long inputs
+    @benchmark(f"argparse/parse {size} tokens", tracked=False, full_only=full_only or argparse_full_only)
+    def setup_argparse():
+        parser = get_argparse_parser()
+        argv = get_long_argv(size)
+        return lambda: parser.parse_intermixed_args(argv)
+
+register_long_argv(10000)
+register_long_argv(100000, argparse_full_only=True)
+register_long_argv(1000000, full_only=True)
+
+@benchmark('parse/short argv with config compile')
+def setup_short_argv():
+    argv = ['-v', '-I', 'x', 'file.txt', '--name=foo']
+    return lambda: QuickParse(None, OPTIONS_CONFIG, cli_args=argv)
+
+def get_bot_command_lines():
+    return [['-v', '-I', f"dir{index}", f"file{index}.txt", '--name=foo', '--quiet'] for index in range(10)]
+
+@benchmark('parse/10 recurring argvs with a compiled spec')
+def setup_parse_recurring_argvs():
+    spec = QuickParse.compile(None, OPTIONS_CONFIG)
+    command_lines = get_bot_command_lines()
+    return lambda: [spec.parse(argv) for argv in command_lines]
+
+@benchmark('parse/10 recurring argvs with a result cache')
+def setup_parse_recurring_argvs_cached():
+    spec = QuickParse.compile(None, OPTIONS_CONFIG, result_cache=True)
+    command_lines = get_bot_command_lines()
+    return lambda: [spec.parse(argv) for argv in command_lines]
+
+@benchmark('argparse/short argv with parser build', tracked=False)
+def setup_argparse_short_argv():
+    argv = ['-v', '-I', 'x', 'file.txt', '--name=foo']
+    return lambda: get_argparse_parser().parse_intermixed_args(argv)
+
+def resolve_path(value):
+    """Stands for a validator doing some work per value"""
+    return tuple(sorted(set(value.split('/'))))
+
+def get_repeated_values_argv():
+    return [arg for index in range(100) for arg in ('--path', f"/srv/data/{index % 10}/reports/latest")]
+
+@benchmark('parse/100 option values with a validator')
+def setup_parse_plain_validator():
+    spec = QuickParse.compile(options_config=[('--path', resolve_path)])
+    argv = get_repeated_values_argv()
+    return lambda: spec.parse(argv)
+
+@benchmark('parse/100 option values with a cacheable validator')
+def setup_parse_cacheable_validator():
+    spec = QuickParse.compile(options_config=[('--path', cacheable(resolve_path))])
+    argv = get_repeated_values_argv()
+    return lambda: spec.parse(argv)
+
+@benchmark('parse/100k file name parameters')
+def setup_parse_file_names():
+    spec = QuickParse.compile()
+    argv = [f"src/module{index}.py" for index in range(100000)]
+    return lambda: spec.parse(argv)
+
+@benchmark('parse/100k numeric parameters into an array')
+def setup_parse_typed_parameters():
+    spec = QuickParse.compile(typed_parameters='array')
+    argv = [str(index * 7) for index in range(100000)]
+    return lambda: spec.parse(argv)
+
+@benchmark('parse/100k arguments from a response file')
+def setup_parse_response_file():
+    spec = QuickParse.compile(options_config=OPTIONS_CONFIG, response_files=True)
+    response_file = tempfile.NamedTemporaryFile('w', suffix='.rsp', delete=False)
+    atexit.register(os.unlink, response_file.name)
+    with response_file:
+        response_file.write('\n'.join(f'"{arg}"' if index % 10 == 0 else arg for index, arg in enumerate(get_long_argv(100000))))
+    argv = [f"@{response_file.name}"]
+    return lambda: spec.parse(argv)
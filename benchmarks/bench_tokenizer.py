@@ -0,0 +1,41 @@
+import shlex
+
+from quickparse import QuickParse
+from quickparse.tokenizer import split_line
+
+from .bench_parsing import OPTIONS_CONFIG
+from .common import benchmark
+
+
+CHATOPS_LINE = """-v -I src/lib --name="release 1.2" 'notes for the team.txt' file\\ with\\ spaces.c -q build.log"""
+
+def get_long_line(size = 10000):
+    return ' '.join(f"file{index}.txt" if index % 4 else f"'quoted {index}'" for index in range(size))
+
+@benchmark('tokenize/chatops line')
+def setup_split_line():
+    return lambda: split_line(CHATOPS_LINE)
+
+@benchmark('tokenize/shlex.split chatops line', tracked=False)
+def setup_shlex_split():
+    return lambda: shlex.split(CHATOPS_LINE)
+
+@benchmark('tokenize/10k arguments')
+def setup_split_long_line():
+    line = get_long_line()
+    return lambda: split_line(line)
+
+@benchmark('tokenize/shlex.split 10k arguments', tracked=False)
+def setup_shlex_split_long_line():
+    line = get_long_line()
+    return lambda: shlex.split(line)
+
+@benchmark('tokenize/parse_string chatops line')
+def setup_parse_string():
+    spec = QuickParse.compile(None, OPTIONS_CONFIG)
+    return lambda: spec.parse_string(CHATOPS_LINE)
+
+@benchmark('tokenize/shlex.split and parse chatops line', tracked=False)
+def setup_shlex_and_parse():
+    spec = QuickParse.compile(None, OPTIONS_CONFIG)
+    return lambda: spec.parse(shlex.split(CHATOPS_LINE))
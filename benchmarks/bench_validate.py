@@ -0,0 +1,37 @@
+from quickparse import QuickParse
+
+from .common import benchmark
+from .bench_configs import get_large_options_config
+
+
+VALIDATOR = {
+    'parameters': {'mincount': 1, 'maxcount': 3},
+    'options': {
+        'mandatory': ('--opt-a', ),
+        'optional': ('--opt-c', '--opt-d', '--opt-e'),
+        'forbidden': ('--opt-f', ),
+    },
+    'numeric': {'maxcount': 1},
+}
+
+ARGV = ['param', '--opt-a', 'x', '--alias-d', '-3']
+
+@benchmark('validate/dict validator, 5k options config')
+def setup_validate_dict():
+    spec = QuickParse.compile(None, get_large_options_config())
+    def run():
+        spec.parse(ARGV).validate(VALIDATOR)
+    return run
+
+@benchmark('validate/compiled validator, 5k options config')
+def setup_validate_compiled():
+    spec = QuickParse.compile(None, get_large_options_config())
+    validator = spec.compile_validator(VALIDATOR)
+    def run():
+        spec.parse(ARGV).validate(validator)
+    return run
+
+@benchmark('validate/parse only, 5k options config')
+def setup_parse_only():
+    spec = QuickParse.compile(None, get_large_options_config())
+    return lambda: spec.parse(ARGV)
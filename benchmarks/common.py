@@ -0,0 +1,30 @@
+import timeit
+from collections import namedtuple
+
+
+Benchmark = namedtuple('Benchmark', ('name', 'setup', 'tracked', 'full_only'))
+
+BENCHMARKS = list()
+
+def benchmark(name, tracked = True, full_only = False):
+    """Registers a setup function that returns the callable to be timed
+
+    Untracked benchmarks (like the argparse ones) are reported for comparison only.
+    full_only benchmarks run only with --full as they take long.
+    """
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, setup, tracked, full_only))
+        return setup
+    return register
+
+def time_callable(func, repeat = 5, min_time = 0.2):
+    """Best time of a single call in seconds"""
+    timer = timeit.Timer(func)
+    number, total = timer.autorange()
+    if total < min_time:
+        number = max(1, int(number * min_time / total)) if total > 0 else number
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def to_letters(index):
+    """Unique letters-only name for an index as commands and options can't have digits"""
+    return ''.join('abcdefghij'[int(digit)] for digit in str(index))
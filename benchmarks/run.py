@@ -0,0 +1,100 @@
+"""Runs the benchmarks and compares the tracked ones to a baseline
+
+python -m benchmarks.run                     # compare to benchmarks/baseline.json
+python -m benchmarks.run --update-baseline   # record the current timings as baseline
+python -m benchmarks.run --full              # include the long running ones like 1M tokens
+
+Exits with 1 if a tracked benchmark got slower than its baseline by more than the threshold.
+Timings depend on the machine, so record the baseline on the machine that runs the comparison.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+
+from .common import BENCHMARKS, time_callable
+
+
+BENCHMARK_MODULES = ('bench_classify', 'bench_parsing', 'bench_configs', 'bench_commands', 'bench_validate', 'bench_execute', 'bench_completion', 'bench_tokenizer')
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+
+
+def load_benchmarks():
+    for module_name in BENCHMARK_MODULES:
+        importlib.import_module(f".{module_name}", __package__)
+    return BENCHMARKS
+
+def run_benchmarks(benchmarks, name_filter = None, full = False):
+    results = dict()
+    for bench in benchmarks:
+        if name_filter is not None and name_filter not in bench.name:
+            continue
+        if bench.full_only and not full:
+            continue
+        results[bench.name] = time_callable(bench.setup())
+        print(f"{bench.name:<60} {format_time(results[bench.name]):>12}", file=sys.stderr)
+    return results
+
+def compare(results, baseline, tracked_names, threshold):
+    regressions = list()
+    rows = list()
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None or name not in tracked_names:
+            rows.append((name, current, previous, None))
+            continue
+        ratio = current / previous
+        rows.append((name, current, previous, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def format_time(seconds):
+    if seconds is None:
+        return '-'
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='QuickParse benchmarks')
+    parser.add_argument('--filter', help='only run benchmarks with this in their names')
+    parser.add_argument('--full', action='store_true', help='include the long running benchmarks')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed slowdown ratio, 0.25 means 25%%')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    benchmarks = load_benchmarks()
+    tracked_names = set(bench.name for bench in benchmarks if bench.tracked)
+    results = run_benchmarks(benchmarks, args.filter, args.full)
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    if args.update_baseline:
+        baseline.update({name: value for name, value in results.items() if name in tracked_names})
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    rows, regressions = compare(results, baseline, tracked_names, args.threshold)
+    print(f"{'benchmark':<60} {'current':>12} {'baseline':>12} {'ratio':>7}")
+    for name, current, previous, ratio in rows:
+        ratio_str = f"{ratio:.2f}" if ratio is not None else '-'
+        marker = ' REGRESSION' if name in regressions else ''
+        print(f"{name:<60} {format_time(current):>12} {format_time(previous):>12} {ratio_str:>7}{marker}")
+    if len(regressions) > 0:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
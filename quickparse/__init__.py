@@ -2,4 +2,9 @@ __version__ = '0.9.0'
 __license__ = "MIT"
 __author__ = 'silkyanteater'
 
-from .quickparse import QuickParse
+from .quickparse import QuickParse, ParserSpec
+from .views import CommandPath
+from .validator import CompiledValidator
+from .stats import ParseStats
+from .completion import Completer, handle_completion_request, get_completion_script
+from .lib import count, cacheable, lazy, subcommands, clear_call_plan_cache, call_plan_cache_info, clear_validator_cache, validator_cache_info
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import pickle
+import sys
+from types import ModuleType
+
+from . import __version__
+
+
+# bumped when the cached attributes of ParserSpec change
+CACHE_FORMAT = 1
+
+CACHED_SPEC_ATTRIBUTES = ('_commands_trie', '_options_equivalency', '_canonical_options', '_canonical_option_list', '_option_ids', '_count_options')
+
+
+def get_cache_key(cache_key):
+    """Hash of the caller's key, the quickparse version, the cache format and the Python version
+
+    cache_key is a string that changes whenever the configs change, e.g. the version of the program,
+    or the module the configs are defined in, which is then represented by the path, size and modification time of its file.
+    """
+    if isinstance(cache_key, ModuleType):
+        module_file = getattr(cache_key, '__file__', None)
+        if module_file is None:
+            raise ValueError(f"cache_key module has no file: {cache_key.__name__}")
+        module_stat = os.stat(module_file)
+        cache_key = f"module:{cache_key.__name__}:{os.path.realpath(module_file)}:{module_stat.st_size}:{module_stat.st_mtime_ns}"
+    elif isinstance(cache_key, str):
+        cache_key = f"str:{cache_key}"
+    else:
+        raise ValueError(f"cache_key must be a string or a module, got this: {cache_key}")
+    tokens = (__version__, str(CACHE_FORMAT), f"{sys.version_info[0]}.{sys.version_info[1]}", cache_key)
+    return hashlib.sha256('\x00'.join(tokens).encode('utf-8', 'surrogatepass')).hexdigest()
+
+def get_cache_path(cache_dir, cache_key):
+    return os.path.join(os.fspath(cache_dir), f"quickparse-{cache_key}.pickle")
+
+def load_spec_state(cache_path):
+    """The cached attributes of a ParserSpec, None if there is no usable cache file"""
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            if not _is_private_file(cache_file):
+                return None
+            state = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # a corrupt or outdated cache file is rewritten after compiling
+        return None
+    if not isinstance(state, dict) or set(state) != set(CACHED_SPEC_ATTRIBUTES):
+        return None
+    return state
+
+def _is_private_file(opened_file):
+    """Whether the file is owned by the user and others can't write it, as unpickling it can run any code"""
+    if not hasattr(os, 'getuid'):
+        return True
+    file_stat = os.fstat(opened_file.fileno())
+    return file_stat.st_uid == os.getuid() and file_stat.st_mode & 0o022 == 0
+
+def save_spec_state(cache_path, spec):
+    """Writes the cached attributes atomically, does nothing if they can't be pickled or written"""
+    state = {name: getattr(spec, name) for name in CACHED_SPEC_ATTRIBUTES}
+    try:
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    # only needed when writing the cache, loading it is what has to be fast
+    import tempfile
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError:
+        return False
+    return True
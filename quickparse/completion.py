@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+from bisect import bisect_left
+from collections import namedtuple
+
+from .quickparse import EVENT_COMMAND, EVENT_SEPARATOR, EVENT_ERROR, ERROR_VALUE_NOT_FOUND, FLAG_VALIDATORS
+
+
+# set by the completion scripts to the index of the argument being completed
+COMPLETE_ENV_VAR = 'QUICKPARSE_COMPLETE'
+
+SHELLS = ('bash', 'zsh', 'fish')
+
+# candidates are the possible completions of the argument at the cursor,
+# value_hint is the name of the validator if the argument is an option value
+Completion = namedtuple('Completion', ('candidates', 'value_hint'))
+
+
+class PrefixIndex(object):
+    """Sorted words, the ones starting with a prefix are found by bisection"""
+
+    __slots__ = ('words', )
+
+    def __init__(self, words):
+        self.words = tuple(sorted(set(words)))
+
+    def find(self, prefix):
+        words = self.words
+        if prefix == '':
+            return words
+        # the words with the prefix sort before the prefix with its last character incremented
+        end_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix[-1] != '\U0010ffff' else None
+        start = bisect_left(words, prefix)
+        end = bisect_left(words, end_prefix, start) if end_prefix is not None else len(words)
+        return words[start:end]
+
+
+class Completer(object):
+    """Completes arguments for a ParserSpec, the prefix indexes are built on first use"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._options_index = None
+        self._command_indexes = dict()
+
+    def complete(self, words, cursor = None):
+        """Candidates for words[cursor], the words before it are parsed to find out what is expected there
+
+        cursor defaults to the last word, with cursor == len(words) an empty word is completed.
+        """
+        words = tuple(words)
+        if cursor is None:
+            cursor = max(len(words) - 1, 0)
+        if not 0 <= cursor <= len(words):
+            raise ValueError(f"cursor must be between 0 and {len(words)}, got {cursor}")
+        word = words[cursor] if cursor < len(words) else ''
+        command_path = list()
+        value_option = None
+        parameters_only = False
+        for event in self.spec.iter_events(words[:cursor]):
+            if event.type == EVENT_COMMAND:
+                command_path.append(event.arg)
+            elif event.type == EVENT_SEPARATOR:
+                parameters_only = True
+            elif event.type == EVENT_ERROR and event.value['type'] == ERROR_VALUE_NOT_FOUND:
+                # reported only for the last argument, so the word at the cursor is its value
+                value_option = event.key
+        if value_option is not None:
+            return Completion((), self._get_value_hint(value_option))
+        if parameters_only:
+            return Completion((), None)
+        if word[:1] in ('-', '+'):
+            if '=' in word:
+                return Completion((), self._get_value_hint(word.split('=', 1)[0]))
+            return Completion(self._get_options_index().find(word), None)
+        command_index = self._get_command_index(self.spec._get_command_level(command_path))
+        if command_index is None:
+            return Completion((), None)
+        return Completion(command_index.find(word), None)
+
+    def _get_value_hint(self, option):
+        validator = self.spec._get_default_validator(option)
+        if validator in FLAG_VALIDATORS:
+            return None
+        return getattr(validator, '__name__', repr(validator))
+
+    def _get_options_index(self):
+        if self._options_index is None:
+            self._options_index = PrefixIndex(self.spec._options_equivalency)
+        return self._options_index
+
+    def _get_command_index(self, command_level):
+        if not isinstance(command_level, dict):
+            return None
+        command_index = self._command_indexes.get(id(command_level))
+        if command_index is None:
+            command_index = PrefixIndex(command for command in command_level if command != '')
+            self._command_indexes[id(command_level)] = command_index
+        return command_index
+
+
+def handle_completion_request(spec, cli_args = None, environ = None, output = None):
+    """Prints the candidates one per line if the program was started by a completion script
+
+    Returns whether it was, the program is expected to exit then.
+    """
+    environ = os.environ if environ is None else environ
+    cursor = environ.get(COMPLETE_ENV_VAR)
+    if cursor is None:
+        return False
+    cli_args = sys.argv[1:] if cli_args is None else cli_args
+    output = sys.stdout if output is None else output
+    try:
+        cursor = int(cursor)
+        candidates = Completer(spec).complete(cli_args, min(max(cursor, 0), len(cli_args))).candidates
+    except ValueError:
+        candidates = ()
+    for candidate in candidates:
+        output.write(f"{candidate}\n")
+    return True
+
+def get_completion_script(prog, shell = 'bash'):
+    """Shell code that completes prog by running it with QUICKPARSE_COMPLETE set, to be sourced by the shell"""
+    if shell not in SHELLS:
+        raise ValueError(f"Shell must be one of {', '.join(SHELLS)}, got this: {shell}")
+    func_name = f"_quickparse_complete_{re.sub(r'[^a-zA-Z0-9_]', '_', os.path.basename(prog))}"
+    return COMPLETION_SCRIPTS[shell].format(prog=prog, func_name=func_name, env_var=COMPLETE_ENV_VAR)
+
+
+COMPLETION_SCRIPTS = {
+    'bash': """\
+{func_name}() {{
+    local IFS=$'\\n'
+    COMPREPLY=( $({env_var}=$((COMP_CWORD - 1)) "${{COMP_WORDS[0]}}" "${{COMP_WORDS[@]:1}}" 2>/dev/null) )
+}}
+complete -o default -F {func_name} {prog}
+""",
+    'zsh': """\
+#compdef {prog}
+{func_name}() {{
+    local -a candidates
+    candidates=( ${{(f)"$({env_var}=$((CURRENT - 2)) "${{words[1]}}" "${{(@)words[2,-1]}}" 2>/dev/null)"}} )
+    if (( ${{#candidates}} )); then
+        compadd -- "${{candidates[@]}}"
+    else
+        _files
+    fi
+}}
+compdef {func_name} {prog}
+""",
+    'fish': """\
+function {func_name}
+    set -l words (commandline -opc)
+    env {env_var}=(math (count $words) - 1) $words (commandline -ct) 2>/dev/null
+end
+complete -c {prog} -a '({func_name})'
+""",
+}
@@ -1,6 +1,12 @@
+import importlib
 import inspect
 import re
+import threading
+import weakref
+from collections import OrderedDict, deque
 from collections.abc import Sequence
+from functools import lru_cache
+from types import FunctionType, MethodType
 
 
 option_key_re = re.compile(r'^(-[a-zA-Z][a-zA-Z\-]*|--[a-zA-Z][a-zA-Z\-]*|\+[a-zA-Z][a-zA-Z\-]*)$')
@@ -16,96 +22,380 @@ arg_res_def = (
     ('param or command', r'.*'),
 )
 arg_res = tuple(map(lambda x: {'type': x[0], 're': re.compile(x[1])}, arg_res_def))
+# the same patterns as one alternation, alternatives are tried in order just like in arg_res
+arg_combined_re = re.compile('|'.join(f"(?P<t{index}>{arg_re_def[1]})" for index, arg_re_def in enumerate(arg_res_def)))
+arg_combined_re_types = {f"t{index}": arg_re_def[0] for index, arg_re_def in enumerate(arg_res_def)}
+
+CLASSIFY_ARG_CACHE_SIZE = 4096
 
 command_re = re.compile(r'[a-zA-Z_\-]+')
 
+# int() or float() can only accept a string matching this, the rest of the parameters are left as they are without trying
+numeric_prefix_re = re.compile(r'\s*[+-]?(?:\d|\.\d|[iI][nN][fF]|[nN][aA][nN])')
+
+
+def get_commands_config_problems(commands_config):
+    """All problems found in the commands config as messages, an empty list if it is valid
 
-def validate_commands_config(commands_config):
+    Every level is visited once and duplicates are looked up in a set, so this is linear in the size of the config.
+    """
+    problems = list()
     if commands_config is None:
-        return
-    _validate_key_instances_and_types(commands_config)
+        return problems
+    if not isinstance(commands_config, dict):
+        problems.append(f"Dict expected as commands config, got this: {commands_config}")
+        return problems
+    # (level, path of commands leading to it), walked without recursion so that deep configs are fine too
+    levels = deque([(commands_config, ())])
+    while len(levels) > 0:
+        commands_config_level, path = levels.popleft()
+        location = f" under '{' '.join(path)}'" if len(path) > 0 else ''
+        level_keys = set()
+        for key, value in commands_config_level.items():
+            if isinstance(key, tuple):
+                for key_elem in key:
+                    if isinstance(key_elem, str):
+                        _check_commands_key(key_elem, level_keys, location, problems)
+                    else:
+                        problems.append(f"Invalid key in commands config{location}: {key_elem}")
+            elif isinstance(key, str):
+                if key == '' and isinstance(value, (dict, subcommands)):
+                    problems.append(f"Empty key in commands_config can't lead to subcommands{location}")
+                _check_commands_key(key, level_keys, location, problems)
+            else:
+                problems.append(f"Invalid key in commands config{location}: {key}")
+            if isinstance(value, dict):
+                levels.append((value, path + ((key[0] if isinstance(key, tuple) and len(key) > 0 else key, ))))
+    return problems
 
-def _validate_key_instances_and_types(commands_config_level):
-    all_keys = list()
-    for key in commands_config_level:
-        if isinstance(key, tuple):
-            for key_elem in key:
-                if isinstance(key_elem, str):
-                    _validate_commands_key(key_elem, all_keys)
-                else:
-                    raise AssertionError(f"Invalid key in commands config: {key_elem}")
-        elif isinstance(key, str):
-            assert key != '' or not isinstance(commands_config_level[''], dict), f"Empty key in commands_config can't lead to subcommands"
-            _validate_commands_key(key, all_keys)
-        else:
-            raise AssertionError(f"Invalid key in commands config: {key}")
-    for key in commands_config_level:
-        if isinstance(commands_config_level[key], dict):
-            _validate_key_instances_and_types(commands_config_level[key])
-
-def _validate_commands_key(key, all_keys):
-    assert key == '' or command_re.match(key) is not None, f"Only [a-zA-Z_-] characteres are allowed in commands config keys, got this: {key}"
-    if key in all_keys:
-        raise AssertionError(f"Duplicate key in commands config: {key}")
+def get_config_problems_message(problems):
+    if len(problems) == 1:
+        return problems[0]
+    return f"{len(problems)} problems found in the configs:\n" + '\n'.join(problems)
+
+def _check_commands_key(key, level_keys, location, problems):
+    if key != '' and command_re.match(key) is None:
+        problems.append(f"Only [a-zA-Z_-] characteres are allowed in commands config keys, got this{location}: {key}")
+    if key in level_keys:
+        problems.append(f"Duplicate key in commands config{location}: {key}")
     else:
-        all_keys.append(key)
+        level_keys.add(key)
 
-def validate_options_config(options_config):
+def get_options_config_problems(options_config):
+    """All problems found in the options config as messages, an empty list if it is valid"""
+    problems = list()
     if options_config is None:
-        return
-    options = list()
-    assert isinstance(options_config, (list, tuple)), f"List expedted as options config, got this: {options}"
+        return problems
+    if not isinstance(options_config, (list, tuple)):
+        problems.append(f"List expedted as options config, got this: {options_config}")
+        return problems
+    options = set()
     for equivalents in options_config:
-        assert isinstance(equivalents, (list, tuple)), f"List expedted as options config item, got this {equivalents}"
+        if not isinstance(equivalents, (list, tuple)):
+            problems.append(f"List expedted as options config item, got this {equivalents}")
+            continue
         validator_count = 0
         for equivalent in equivalents:
             if isinstance(equivalent, str):
                 equivalent_stripped = equivalent.strip()
-                assert option_key_re.match(equivalent_stripped) is not None , f"Valid option formats: '-*', '--*' or '+*' followed by letters and '-'s not in the first place, got this: {equivalent}"
-                assert equivalent_stripped not in options, f"Option name found multiple times in options config: {equivalent_stripped}"
-                options.append(equivalent_stripped)
+                if option_key_re.match(equivalent_stripped) is None:
+                    problems.append(f"Valid option formats: '-*', '--*' or '+*' followed by letters and '-'s not in the first place, got this: {equivalent}")
+                if equivalent_stripped in options:
+                    problems.append(f"Option name found multiple times in options config: {equivalent_stripped}")
+                else:
+                    options.add(equivalent_stripped)
             elif not callable(equivalent):
-                raise AssertionError(f"Strings or callable validators are accepted in an options config item, got this: {equivalent}")
+                problems.append(f"Strings or callable validators are accepted in an options config item, got this: {equivalent}")
             else:
                 validator_count += 1
-                assert validator_count <= 1, f"More than one validator found here: {equivalents}"
+                if validator_count == 2:
+                    problems.append(f"More than one validator found here: {equivalents}")
+    return problems
+
+class LRUCache(object):
+    """Size bounded mapping that drops the least recently used entries, safe to share between threads"""
+
+    __slots__ = ('maxsize', '_entries', '_lock', '_stats')
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """The value stored for key, None if there is none"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self, maxsize = None):
+        """Empties the cache and resets its statistics, maxsize changes its bound"""
+        with self._lock:
+            self._entries.clear()
+            self._stats.update(hits=0, misses=0, evictions=0)
+            if maxsize is not None:
+                self.maxsize = maxsize
+
+    def info(self):
+        with self._lock:
+            return {**self._stats, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def __reduce__(self):
+        # the entries are not worth sending to other processes
+        return (LRUCache, (self.maxsize, ))
+
+def count(value):
+    """Marks a flag to be counted when used as its type: '-vvv' or '-v -v -v' gives 3 instead of a tuple of True
+
+    It doesn't convert values, the parser counts the flag without calling it.
+    """
+    raise TypeError("count marks counted flags in an options config, it is not a validator to be called")
+
+VALIDATOR_CACHE_SIZE = 4096
+UNREFERENCEABLE_CALL_PLAN_CACHE_SIZE = 256
+
+class cacheable(object):
+    """Marks a validator to have its results and raised errors memoized per value
+
+    All cacheable validators share one LRU cache of the process, see validator_cache_info().
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.__name__ = getattr(validator, '__name__', repr(validator))
+
+    def __call__(self, value):
+        return _call_cacheable(self.validator, value)
+
+    def __repr__(self):
+        return f"cacheable({self.validator!r})"
+
+_validator_cache = LRUCache(VALIDATOR_CACHE_SIZE)
+
+def _call_cacheable(validator, value):
+    key = (validator, value)
+    entry = _validator_cache.get(key)
+    if entry is None:
+        # called without holding the lock of the cache as validators may take long
+        try:
+            entry = (True, validator(value))
+        except Exception as e:
+            entry = (False, e)
+        _validator_cache.put(key, entry)
+    is_valid, result = entry
+    if is_valid:
+        return result
+    raise result.with_traceback(None)
+
+def clear_validator_cache(maxsize = None):
+    """Empties the cache of cacheable validators and resets its statistics, maxsize changes its bound"""
+    _validator_cache.clear(maxsize)
+
+def validator_cache_info():
+    return _validator_cache.info()
+
+class lazy(object):
+    """Handler given by its import path as 'package.module:function', the module is imported when it is executed
+
+    The function part can be a dotted path too, like 'package.module:Class.method'.
+    """
+
+    __slots__ = ('path', '_func')
+
+    def __init__(self, path):
+        module_name, _, func_name = path.partition(':')
+        if module_name == '' or func_name == '':
+            raise ValueError(f"Import path expected as 'package.module:function', got this: {path}")
+        self.path = path
+        self._func = None
+
+    @property
+    def __name__(self):
+        return self.path.rpartition(':')[2].rpartition('.')[2]
+
+    @property
+    def is_resolved(self):
+        return self._func is not None
+
+    def resolve(self):
+        """Imports the module and returns the function, it is looked up only once"""
+        if self._func is None:
+            module_name, _, func_name = self.path.partition(':')
+            func = importlib.import_module(module_name)
+            try:
+                for name in func_name.split('.'):
+                    func = getattr(func, name)
+            except AttributeError as e:
+                raise ImportError(f"Handler not found: {self.path}") from e
+            self._func = func
+        return self._func
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __reduce__(self):
+        # a process pool resolves it again on its side
+        return (lazy, (self.path, ))
+
+    def __repr__(self):
+        return f"lazy({self.path!r})"
+
+class subcommands(object):
+    """Level of the commands config supplied by a loader, loaded only when parsing descends into it
+
+    The loader is a callable returning the commands config of the level, or an import path as
+    'package.module:name' of such a callable or of the config itself. It is called at most once,
+    the config it gives is validated and its trie is kept.
+    """
+
+    __slots__ = ('loader', '_trie', '_lock')
+
+    def __init__(self, loader):
+        if isinstance(loader, str):
+            loader = lazy(loader)
+        elif not callable(loader):
+            raise ValueError(f"Callable or import path expected as subcommands loader, got this: {loader}")
+        self.loader = loader
+        self._trie = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._trie is not None
+
+    def get_trie(self):
+        if self._trie is None:
+            with self._lock:
+                if self._trie is None:
+                    commands_config = self.loader.resolve() if isinstance(self.loader, lazy) else self.loader
+                    if callable(commands_config):
+                        commands_config = commands_config()
+                    problems = get_commands_config_problems(commands_config)
+                    if len(problems) > 0:
+                        raise ValueError(get_config_problems_message(problems))
+                    self._trie = build_commands_trie(commands_config)
+        return self._trie
+
+    def __reduce__(self):
+        # loaded again after unpickling, e.g. from the config cache or in a process pool
+        return (subcommands, (self.loader, ))
+
+    def __repr__(self):
+        return f"subcommands({self.loader!r})"
 
 def humblecall(func, *args, **kwargs):
     if not callable(func):
         return func
-    args = list(args)
-    positional_only_args, positional_or_keyword_args, has_positional_var, keyword_only_args, has_keyword_var = _get_func_signature_data(func)
+    if isinstance(func, lazy):
+        func = func.resolve()
+    positional_only_args, positional_or_keyword_args, has_positional_var, keyword_only_arg_names, \
+        required_keyword_only_arg_names, has_keyword_var = _get_call_plan(func)
     missing_args = list()
-    if len(positional_only_args) > len(args):
-        for extra_poso_arg in positional_only_args[len(args):]:
-            if not extra_poso_arg['has_default']:
-                missing_args.append(extra_poso_arg['name'])
-    matched_args = args[:len(positional_only_args)]
-    args = args[len(positional_only_args):]
-    for pork_arg in positional_or_keyword_args:
-        name = pork_arg['name']
-        if name in kwargs:
-            matched_args.append(kwargs[name])
-            del kwargs[name]
-        else:
-            if len(args) > 0:
-                matched_args.append(args.pop(0))
-            elif not pork_arg['has_default']:
+    positional_only_count = len(positional_only_args)
+    if positional_only_count > len(args):
+        for name, has_default in positional_only_args[len(args):]:
+            if not has_default:
                 missing_args.append(name)
-    keyword_only_arg_names = list()
-    for kwo_arg in keyword_only_args:
-        name = kwo_arg['name']
-        if not kwo_arg['has_default'] and name not in kwargs:
+    matched_args = list(args[:positional_only_count])
+    args_index = positional_only_count
+    for name, has_default in positional_or_keyword_args:
+        if name in kwargs:
+            matched_args.append(kwargs.pop(name))
+        elif args_index < len(args):
+            matched_args.append(args[args_index])
+            args_index += 1
+        elif not has_default:
+            missing_args.append(name)
+    for name in required_keyword_only_arg_names:
+        if name not in kwargs:
             missing_args.append(name)
-        keyword_only_arg_names.append(name)
     if len(missing_args) > 0:
         raise TypeError(f"Arguments for calling {func.__name__}() are missing: {', '.join(missing_args)}")
     if has_positional_var:
-        matched_args += args
+        matched_args += args[args_index:]
     if not has_keyword_var:
         kwargs = {key: value for key, value in kwargs.items() if key in keyword_only_arg_names}
     return func(*matched_args, **kwargs)
 
+# call plans are keyed weakly by the callable, bound methods by their underlying function
+# and instances of classes with a __call__ function by that, the instances have the same signature
+_call_plans = weakref.WeakKeyDictionary()
+_bound_method_call_plans = weakref.WeakKeyDictionary()
+_instance_call_plans = weakref.WeakKeyDictionary()
+# for other callables that can't be weakly referenced, like instances with __slots__ calling a partial, bounded as they are kept alive
+_unreferenceable_call_plans = LRUCache(UNREFERENCEABLE_CALL_PLAN_CACHE_SIZE)
+_call_plan_cache_stats = {'hits': 0, 'misses': 0}
+
+def _get_call_plan(func):
+    if isinstance(func, FunctionType):
+        call_plans, key = _call_plans, func
+    elif isinstance(func, MethodType):
+        call_plans, key = _bound_method_call_plans, func.__func__
+    elif isinstance(getattr(type(func), '__call__', None), FunctionType):
+        call_plans, key = _instance_call_plans, type(func).__call__
+    else:
+        call_plans, key = _call_plans, func
+    try:
+        call_plan = call_plans.get(key)
+    except TypeError:
+        # not weakly referenceable or not hashable
+        try:
+            call_plan = _unreferenceable_call_plans.get(key)
+        except TypeError:
+            _call_plan_cache_stats['misses'] += 1
+            return _build_call_plan(func)
+        call_plans = _unreferenceable_call_plans
+    if call_plan is not None:
+        _call_plan_cache_stats['hits'] += 1
+        return call_plan
+    _call_plan_cache_stats['misses'] += 1
+    call_plan = _build_call_plan(func)
+    if call_plans is _unreferenceable_call_plans:
+        call_plans.put(key, call_plan)
+    else:
+        call_plans[key] = call_plan
+    return call_plan
+
+def _build_call_plan(func):
+    positional_only_args, positional_or_keyword_args, has_positional_var, keyword_only_args, has_keyword_var = _get_func_signature_data(func)
+    return (
+        tuple((arg['name'], arg['has_default']) for arg in positional_only_args),
+        tuple((arg['name'], arg['has_default']) for arg in positional_or_keyword_args),
+        has_positional_var,
+        frozenset(arg['name'] for arg in keyword_only_args),
+        tuple(arg['name'] for arg in keyword_only_args if not arg['has_default']),
+        has_keyword_var,
+    )
+
+def clear_call_plan_cache():
+    _call_plans.clear()
+    _bound_method_call_plans.clear()
+    _instance_call_plans.clear()
+    _unreferenceable_call_plans.clear()
+    _call_plan_cache_stats['hits'] = 0
+    _call_plan_cache_stats['misses'] = 0
+
+def call_plan_cache_info():
+    return {
+        'hits': _call_plan_cache_stats['hits'],
+        'misses': _call_plan_cache_stats['misses'],
+        'size': len(_call_plans) + len(_bound_method_call_plans) + len(_instance_call_plans) + _unreferenceable_call_plans.info()['size'],
+    }
+
 def _get_func_signature_data(func):
     positional_only_args = list()
     positional_or_keyword_args = list()
@@ -130,39 +420,34 @@ def _get_func_signature_data(func):
     return positional_only_args, positional_or_keyword_args, has_positional_var, keyword_only_args, has_keyword_var
 
 def get_arg_type(arg):
-    for arg_re in arg_res:
-        if arg_re['re'].match(arg) is not None:
-            return arg_re['type']
-    raise RuntimeError(f"Incomplete regular expression coverage of argument {arg}")
-
-def get_equivalent_commands(commands, commands_config):
-    if len(commands) == 0:
-        return tuple()
-    if commands_config is None:
-        return (' '.join(commands), )
-    command_equivalents_per_level = list()
-    commands_config_level = commands_config
-    for command in commands:
-        if command in commands_config_level:
-            command_equivalents_per_level.append((command, ))
-            commands_config_level = commands_config_level[command]
-            continue
-        for equivalent_group, next_commands_config_level in commands_config_level.items():
-            if isinstance(equivalent_group, tuple) and command in equivalent_group:
-                command_equivalents_per_level.append(equivalent_group)
-                commands_config_level = next_commands_config_level
-                break
-    permutations = _get_permutations([[]], command_equivalents_per_level)
-    return tuple(' '.join(permutation) for permutation in permutations)
-
-def _get_permutations(permutations, items):
-    if len(items) == 0:
-        return permutations
-    new_permutations = list()
-    for item in items[0]:
-        for permutation in permutations:
-            new_permutations.append(permutation + [item])
-    return _get_permutations(new_permutations, items[1:])
+    return classify_arg(arg)[0]
+
+@lru_cache(maxsize=CLASSIFY_ARG_CACHE_SIZE)
+def classify_arg(arg):
+    """Returns (arg_type, prefix, key, value) matching arg against all arg_res_def patterns in one go
+
+    prefix is the leading '-', '+' or '--', key is the option name and value is what comes after it
+    (an int for numerics), whichever is applicable for the type
+    """
+    match = arg_combined_re.match(arg)
+    if match is None:
+        raise RuntimeError(f"Incomplete regular expression coverage of argument {arg}")
+    arg_type = arg_combined_re_types[match.lastgroup]
+    if arg_type == 'param or command':
+        return arg_type, None, None, arg
+    if arg_type == 'parameters only separator':
+        return arg_type, '--', None, None
+    if arg_type == 'numeric':
+        return arg_type, arg[0], None, int(arg[1:])
+    if arg_type == 'option and value':
+        key, value = arg.split('=', 1)
+        return arg_type, key[:2] if key[1] == '-' else key[0], key, value
+    if arg_type == 'doubleminus option':
+        return arg_type, '--', arg, None
+    if arg_type == 'single letter':
+        return arg_type, arg[0], arg, None
+    # 'long option' or 'potential letter and value': key is the first letter option, value is the rest
+    return arg_type, arg[0], arg[:2], arg[2:]
 
 def get_options_equivalency(options_config):
     if options_config is None:
@@ -176,6 +461,15 @@ def get_options_equivalency(options_config):
             options_equivalency[eq_option] = equivalency
     return options_equivalency
 
+def get_canonical_options(options_equivalency):
+    """Maps every option to the first one of its equivalents"""
+    return {option: equivalency['equivalents'][0] for option, equivalency in options_equivalency.items()}
+
+def get_option_ids(canonical_options, canonical_option_list):
+    """Maps every option to the index of its canonical option in canonical_option_list"""
+    canonical_ids = {canonical: option_id for option_id, canonical in enumerate(canonical_option_list)}
+    return {option: canonical_ids[canonical] for option, canonical in canonical_options.items()}
+
 def expand_commands_config_keys(commands_config_level):
     if commands_config_level is None:
         return {'': None}
@@ -194,5 +488,20 @@ def expand_commands_config_keys(commands_config_level):
             deep_expanded_commands_config[key] = value
     return deep_expanded_commands_config
 
+def build_commands_trie(commands_config_level):
+    """Maps every command on a level to a tuple of its equivalents group and the next level
+
+    The next level is a dict built the same way for subcommands, otherwise the value from the config.
+    """
+    if commands_config_level is None:
+        return {'': (('', ), None)}
+    commands_trie_level = dict()
+    for key, value in commands_config_level.items():
+        equivalents_group = key if isinstance(key, tuple) else (key, )
+        entry = (equivalents_group, build_commands_trie(value) if isinstance(value, dict) else value)
+        for command in equivalents_group:
+            commands_trie_level[command] = entry
+    return commands_trie_level
+
 def is_non_stringlike_sequence(item):
     return isinstance(item, Sequence) and not isinstance(item, (str, bytes))
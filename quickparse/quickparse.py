@@ -1,389 +1,813 @@
+import inspect
 import sys
-from collections.abc import Iterable, Sequence
+import time
+from array import array
+from collections import deque, namedtuple
+from collections.abc import Iterable
+from functools import cached_property
+from itertools import islice
 
 from .lib import (
-    validate_commands_config,
-    validate_options_config,
+    get_commands_config_problems,
+    get_options_config_problems,
+    get_config_problems_message,
+    subcommands,
     humblecall,
-    get_arg_type,
-    get_equivalent_commands,
+    classify_arg,
+    build_commands_trie,
     get_options_equivalency,
+    get_canonical_options,
+    get_option_ids,
     expand_commands_config_keys,
     is_non_stringlike_sequence,
+    LRUCache,
+    count,
+    numeric_prefix_re,
 )
+from .views import OptionsView, ErrorsView, CommandPath
+from .validator import CompiledValidator
+from .stats import ParseStats, get_timer, run_timed
+from .response_files import ResponseFileExpander, RESPONSE_FILE_MODES
+from .tokenizer import LineTokenizer
 
 
-class QuickParse(object):
+ERROR_TYPE_VALIDATION = 0
+ERROR_VALUE_NOT_FOUND = 1
+ERROR_INCOMPLETE_COMMAND = 2
+ERROR_QUOTING = 3
+ERROR_RESPONSE_FILE = 4
 
-    ERROR_TYPE_VALIDATION = 0
-    ERROR_VALUE_NOT_FOUND = 1
-    ERROR_INCOMPLETE_COMMAND = 2
+EVENT_COMMAND = 'command'
+EVENT_COMMANDS_RESOLVED = 'commands resolved'
+EVENT_OPTION = 'option'
+EVENT_PARAMETER = 'parameter'
+EVENT_NUMERIC = 'numeric'
+EVENT_PLUSNUMERIC = 'plusnumeric'
+EVENT_SEPARATOR = 'parameters only separator'
+EVENT_ERROR = 'error'
 
-    def __init__(self, commands_config = None, options_config = None, cli_args = None):
-        if cli_args is None:
-            self.args = tuple(sys.argv[1:])
-        else:
-            if not (isinstance(cli_args, Iterable) and all(isinstance(element, str) for element in cli_args)):
-                raise ValueError(f"cli_args must be a list of strings")
-            self.args = tuple(cli_args[:])
+# seconds between checks whether the handlers queued in a pool started running
+POOL_POLL_INTERVAL = 0.01
+
+# ints up to this magnitude are exact as floats
+FLOAT_EXACT_INT_LIMIT = 2 ** 53
+
+# number of results kept with result_cache=True
+RESULT_CACHE_SIZE = 1024
+
+# options with these validators don't take a value
+FLAG_VALIDATORS = (None, bool, count)
+
+# arg is the argument the event comes from - None if an earlier event already carried it
+ParseEvent = namedtuple('ParseEvent', ('type', 'arg', 'key', 'value'))
+
+
+class ParserSpec(object):
+    """Validated and expanded configs, reusable for parsing any number of argument lists"""
+
+    def __init__(self, commands_config = None, options_config = None, profile = False, cache_dir = None, typed_parameters = False, response_files = False,
+            result_cache = None, uncached_options = (), cache_key = None):
+        """profile is True or a hook called as hook(phase, seconds, stats) to collect ParseStats
+
+        With cache_dir the compiled configs are stored in that directory and loaded on later runs
+        without validating the configs again. cache_key tells when the configs change, it is a string
+        like the version of the program or the module the configs are defined in.
+        With typed_parameters parameters that are all numbers are collected in an array.array ('array'),
+        a NumPy array ('numpy') or a NumPy array if NumPy is installed and an array.array otherwise (True).
+        With response_files @file arguments are replaced by the arguments in the file, separated by whitespace
+        with quoting (True or 'quoted') or by NUL characters ('nul').
+        With result_cache the results of the last that many argument lists (RESULT_CACHE_SIZE if True) are kept
+        and parsing the same arguments again copies them, unless they have any of the uncached_options.
+        """
         self.commands_config = commands_config
         self.options_config = options_config
-        try:
-            validate_commands_config(self.commands_config)
-            validate_options_config(self.options_config)
-        except AssertionError as ae:
-            raise ValueError(ae) from ae
-        self._expanded_commands_config = expand_commands_config_keys(self.commands_config)
+        self.profile = profile
+        self.typed_parameters = typed_parameters
+        self._array_type = _get_array_type(typed_parameters)
+        self.response_files = response_files
+        self._response_file_mode = _get_response_file_mode(response_files)
+        self.stats = self._new_stats()
+        if cache_dir is None:
+            self._compile()
+        elif cache_key is None:
+            raise ValueError(f"cache_key is needed with cache_dir to tell when the configs change")
+        else:
+            self._compile_with_cache(cache_dir, cache_key)
+        self._result_cache = _get_result_cache(result_cache)
+        self._uncached_options = self._get_uncached_options(uncached_options)
+
+    def _compile(self):
+        run_timed(self.stats, 'config validation', self._validate_configs)
+        run_timed(self.stats, 'commands trie', self._build_commands_trie)
+        run_timed(self.stats, 'options equivalency', self._build_options_equivalency)
+
+    def _validate_configs(self):
+        problems = get_commands_config_problems(self.commands_config) + get_options_config_problems(self.options_config)
+        if len(problems) > 0:
+            raise ValueError(get_config_problems_message(problems))
+
+    def _build_commands_trie(self):
+        self._commands_trie = build_commands_trie(self.commands_config)
+
+    def _build_options_equivalency(self):
         self._options_equivalency = get_options_equivalency(self.options_config)
-        self.commands = list()
-        self.parameters = list()
-        self.options = dict()
-        self.non_commands = list()
-        self.errors = dict()
-        self.to_execute = None
-        self.numeric = None
-        self.plusnumeric = None
-        self._process_args()
+        self._canonical_options = get_canonical_options(self._options_equivalency)
+        self._canonical_option_list = tuple(dict.fromkeys(self._canonical_options.values()))
+        self._option_ids = get_option_ids(self._canonical_options, self._canonical_option_list)
+        self._count_options = frozenset(self._canonical_options[option] for option, equivalency in self._options_equivalency.items() \
+            if equivalency['validator'] == count)
 
-    def execute(self, *_args, **kwargs):
-        kwargs.setdefault('quickparse', self)
-        return_values = list()
-        if isinstance(self.to_execute, tuple):
-            for try_to_call in self.to_execute:
-                return_values.append(humblecall(try_to_call, *_args, **kwargs))
-            return_values = tuple(return_values)
-        else:
-            return_values = humblecall(self.to_execute, *_args, **kwargs)
-        return return_values
+    def _compile_with_cache(self, cache_dir, cache_key):
+        # not imported at the top to keep the startup of CLIs not using the cache short
+        from .cache import get_cache_key, get_cache_path, load_spec_state, save_spec_state
+        with get_timer(self.stats)('config cache'):
+            cache_path = get_cache_path(cache_dir, get_cache_key(cache_key))
+            state = load_spec_state(cache_path)
+            if state is not None:
+                for name, value in state.items():
+                    setattr(self, name, value)
+                return
+        self._compile()
+        save_spec_state(cache_path, self)
 
-    @property
-    def has_errors(self):
-        return len(self.errors) > 0
+    def parse(self, cli_args = None):
+        return QuickParse._from_spec(self, cli_args)
 
-    @property
-    def error_messages(self):
-        return set(error['message'] for error in self.errors.values())
+    def parse_string(self, line, comments = False):
+        """Parses a command line string, split into arguments like a POSIX shell does while they are consumed
 
-    def validate(self, validator):
-        if not isinstance(validator, dict):
-            raise RuntimeError(f"Validator must be a dict")
-        parameters_validator = validator.get('parameters', dict())
-        if len(parameters_validator) > 0:
-            self._validate_parameters(parameters_validator)
-        options_validator = validator.get('options', dict())
-        if len(options_validator) > 0:
-            self._validate_options(options_validator)
-        numeric_validator = validator.get('numeric', dict())
-        if len(numeric_validator) > 0:
-            self._validate_numeric(numeric_validator)
-        plusnumeric_validator = validator.get('plusnumeric', dict())
-        if len(plusnumeric_validator) > 0:
-            self._validate_numeric(plusnumeric_validator, numeric_type='plusnumeric')
-
-    def _validate_parameters(self, parameters_validator):
-        count = parameters_validator.get('count')
-        mincount = parameters_validator.get('mincount')
-        maxcount = parameters_validator.get('maxcount')
-        if count is not None:
-            try:
-                count = int(count)
-            except TypeError:
-                raise RuntimeError(f"Validator>parameter>count must be an integer")
-            if mincount is not None or maxcount is not None:
-                raise RuntimeError(f"Validator>parameter>count is mutually exclusive with mincount and maxcount")
-            if len(self.parameters) != count:
-                if count == 0:
-                    self._add_error(self.ERROR_TYPE_VALIDATION, 'parameters.count', f"No parameters expected")
-                else:
-                    self._add_error(self.ERROR_TYPE_VALIDATION, 'parameters.count', f"{count} parameters expected, got {len(self.parameters)}")
-        else:
-            if mincount is not None:
-                try:
-                    mincount = int(mincount)
-                except TypeError:
-                    raise RuntimeError(f"Validator>parameter>mincount must be an integer")
-                if len(self.parameters) < mincount:
-                    self._add_error(self.ERROR_TYPE_VALIDATION, 'parameters.mincount', f"Minimum number of parameters: {mincount}")
-            if maxcount is not None:
-                try:
-                    maxcount = int(maxcount)
-                except TypeError:
-                    raise RuntimeError(f"Validator>parameter>maxcount must be an integer")
-                if len(self.parameters) > maxcount:
-                    if maxcount == 0:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, 'parameters.maxcount', f"No parameters expected")
-                    else:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, 'parameters.maxcount', f"Maximum number of parameters: {maxcount}")
-
-    def _validate_options(self, options_validator):
-        mandatory = options_validator.get('mandatory')
-        if 'optional' in options_validator:
-            optional = options_validator['optional']
-            if optional is None:
-                optional = tuple()
-        else:
-            optional = None
-        forbidden = options_validator.get('forbidden')
-        mandatory_with_equivalents_flat = set()
-        if mandatory is not None:
-            if isinstance(mandatory, str):
-                mandatory = (mandatory, )
-            if not isinstance(mandatory, Iterable) or not all(isinstance(option, str) for option in mandatory):
-                raise RuntimeError(f"Validator>options>mandatory must be a string or list of strings")
-            mandatory_with_equivalents = set()
-            mandatory_with_equivalents_flat = set()
-            for option in mandatory:
-                equivalents = self._options_equivalency.get(option, {}).get('equivalents', (option, ))
-                mandatory_with_equivalents.add(tuple(sorted(equivalents)))
-                mandatory_with_equivalents_flat.update(equivalents)
-            missing_mandatory_with_equivalents = set()
-            for option in mandatory_with_equivalents:
-                if option[0] not in self.options:
-                    missing_mandatory_with_equivalents.add(option)
-            if len(missing_mandatory_with_equivalents) > 0:
-                missing_mandatory_strs = tuple('/'.join(option_equivalents) for option_equivalents in missing_mandatory_with_equivalents)
-                self._add_error(self.ERROR_TYPE_VALIDATION, 'options.mandatory', \
-                    f"Mandatory options missing: {', '.join(missing_mandatory_str for missing_mandatory_str in missing_mandatory_strs)}")
-        if optional is not None:
-            if isinstance(optional, str):
-                optional = (optional, )
-            if not isinstance(optional, Iterable) or not all(isinstance(option, str) for option in optional):
-                raise RuntimeError(f"Validator>options>optional must be a string or list of strings")
-            mandatory_and_optional_with_equivalents_flat = set(mandatory_with_equivalents_flat)
-            for option in optional:
-                mandatory_and_optional_with_equivalents_flat.update(self._options_equivalency.get(option, {}).get('equivalents', (option, )))
-            forbidden_with_equivalents_flat = set()
-            for option in self.options:
-                if option not in mandatory_and_optional_with_equivalents_flat:
-                    forbidden_with_equivalents_flat.add(option)
-            forbidden_with_equivalents = set()
-            for option in forbidden_with_equivalents_flat:
-                equivalents = self._options_equivalency.get(option, {}).get('equivalents', (option, ))
-                forbidden_with_equivalents.add(tuple(sorted(equivalents)))
-            if len(forbidden_with_equivalents) > 0:
-                forbidden_strs = tuple('/'.join(option_equivalents) for option_equivalents in forbidden_with_equivalents)
-                self._add_error(self.ERROR_TYPE_VALIDATION, 'options.optional', \
-                    f"Option not applicable: {', '.join(forbidden_str for forbidden_str in forbidden_strs)}")
-        if forbidden is not None:
-            if isinstance(forbidden, str):
-                forbidden = (forbidden, )
-            if not isinstance(forbidden, Iterable) or not all(isinstance(option, str) for option in forbidden):
-                raise RuntimeError(f"Validator>options>forbidden must be a string or list of strings")
-            forbidden_with_equivalents_flat = set()
-            for option in self.options:
-                if option in forbidden:
-                    forbidden_with_equivalents_flat.update(self._options_equivalency.get(option, {}).get('equivalents', (option, )))
-            forbidden_with_equivalents = set()
-            for option in forbidden_with_equivalents_flat:
-                equivalents = self._options_equivalency.get(option, {}).get('equivalents', (option, ))
-                forbidden_with_equivalents.add(tuple(sorted(equivalents)))
-            if len(forbidden_with_equivalents) > 0:
-                forbidden_strs = tuple('/'.join(option_equivalents) for option_equivalents in forbidden_with_equivalents)
-                self._add_error(self.ERROR_TYPE_VALIDATION, 'options.forbidden', \
-                    f"Option not applicable: {', '.join(forbidden_str for forbidden_str in forbidden_strs)}")
-
-    def _validate_numeric(self, numeric_validator, *, numeric_type = None):
-        count = numeric_validator.get('count')
-        mincount = numeric_validator.get('mincount')
-        maxcount = numeric_validator.get('maxcount')
-        if numeric_type == 'plusnumeric':
-            numeric_flags = self.plusnumeric if isinstance(self.plusnumeric, Sequence) else (self.plusnumeric, ) if self.plusnumeric is not None else None
-            msg_key = 'plusnumeric'
-        else:
-            numeric_flags = self.numeric if isinstance(self.numeric, Sequence) else (self.numeric, ) if self.numeric is not None else None
-            msg_key = 'numeric'
-        if count is not None:
+        With comments a '#' starting an argument comments out the rest of the line. Bad quoting is reported
+        as an ERROR_QUOTING error with the position in the line, the result cache is not used.
+        """
+        return QuickParse._from_string(self, line, comments)
+
+    def _get_uncached_options(self, uncached_options):
+        for option in uncached_options:
+            if option not in self._canonical_options:
+                raise ValueError(f"Option not found in options config: {option}")
+        return frozenset(self._canonical_options[option] for option in uncached_options)
+
+    def _is_result_cacheable(self, args):
+        # the content of response files can change between parses
+        return self._response_file_mode is None or not any(arg[:1] == '@' for arg in args)
+
+    def result_cache_info(self):
+        """Hits, misses, evictions, size and maxsize of the result cache, None if there is no result cache"""
+        if self._result_cache is None:
+            return None
+        return self._result_cache.info()
+
+    def clear_result_cache(self):
+        if self._result_cache is not None:
+            self._result_cache.clear()
+
+    def _new_stats(self):
+        if not self.profile:
+            return None
+        return ParseStats(self.profile if callable(self.profile) else None)
+
+    def parse_many(self, cli_args_iterable, workers = None, chunksize = 256):
+        """Parses each argument list, yielding the results in input order
+
+        With workers > 1 the argument lists are parsed in chunks in a process pool, in which case
+        the configs and the parsed option values have to be picklable.
+        """
+        if workers is None or workers <= 1:
+            return (self.parse(cli_args) for cli_args in cli_args_iterable)
+        return self._parse_many_in_processes(cli_args_iterable, workers, chunksize)
+
+    def _parse_many_in_processes(self, cli_args_iterable, workers, chunksize):
+        # imported here as it takes longer than importing the rest of the package
+        from concurrent.futures import ProcessPoolExecutor
+        cli_args_iterator = iter(cli_args_iterable)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(self, )) as executor:
+            pending = deque()
             try:
-                count = int(count)
-            except TypeError:
-                raise RuntimeError(f"Validator>{msg_key}>count must be an integer")
-            if mincount is not None or maxcount is not None:
-                raise RuntimeError(f"Validator>{msg_key}>count is mutually exclusive with mincount and maxcount")
-            if numeric_flags is None:
-                if count != 0:
-                    self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"{count} {msg_key} flag{'s' if count > 0 else ''} expected")
+                while True:
+                    chunk = tuple(QuickParse._get_args(cli_args) for cli_args in islice(cli_args_iterator, chunksize))
+                    if len(chunk) > 0:
+                        pending.append(executor.submit(_parse_chunk_in_worker, chunk))
+                    # keep a bounded number of chunks in flight so that results stream back
+                    while len(pending) > 0 and (len(chunk) == 0 or len(pending) >= workers * 2):
+                        for state in pending.popleft().result():
+                            yield QuickParse._from_state(self, state)
+                    if len(chunk) == 0:
+                        break
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @cached_property
+    def _expanded_commands_config(self):
+        return expand_commands_config_keys(self.commands_config)
+
+    def _get_command_level(self, command_path):
+        command_level = self._commands_trie
+        for command in command_path:
+            command_level = command_level[command][1]
+            if isinstance(command_level, subcommands):
+                command_level = command_level.get_trie()
+        return command_level
+
+    @staticmethod
+    def _get_to_execute(command_level):
+        if isinstance(command_level, dict):
+            command_level = command_level.get('', (None, None))[1]
+        if is_non_stringlike_sequence(command_level):
+            return tuple(command_level)
+        return command_level
+
+    def _get_default_validator(self, option):
+        return self._options_equivalency.get(option, {}).get('validator', None)
+
+    def compile_validator(self, validator):
+        return CompiledValidator(self, validator)
+
+    def iter_events(self, cli_args_iterable):
+        """Parses arguments from any iterable lazily, yielding a ParseEvent as each argument is consumed
+
+        The arguments are not collected, so memory use doesn't grow with the number of arguments.
+        An EVENT_COMMANDS_RESOLVED event is yielded as soon as the command is known.
+        Problems with response files are yielded as EVENT_ERROR events after the arguments.
+        """
+        return self._iter_args_events(_iter_checked_args(cli_args_iterable))
+
+    def _iter_args_events(self, args, stats = None):
+        if self._response_file_mode is None:
+            return self._iter_events(iter(args), stats)
+        return self._iter_expanded_events(ResponseFileExpander(args, self._response_file_mode), stats)
+
+    def _iter_expanded_events(self, expander, stats):
+        yield from self._iter_events(iter(expander), stats)
+        targets = set()
+        for kind, path, position, token, message in expander.errors:
+            # an unclosed quote can be followed by a trailing backslash in the same argument, the quote is the cause
+            if token in targets:
+                continue
+            targets.add(token)
+            if kind == 'quoting':
+                yield ParseEvent(EVENT_ERROR, None, token, {'type': ERROR_QUOTING, 'message': message, 'position': position, 'file': path})
             else:
-                if len(numeric_flags) != count:
-                    if count == 0:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"{msg_key.capitalize()} flags are not applicable")
-                    else:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"Expected {count} {msg_key} flags, got {len(numeric_flags)}")
-        else:
-            if mincount is not None:
-                try:
-                    mincount = int(mincount)
-                except TypeError:
-                    raise RuntimeError(f"Validator>{msg_key}>mincount must be an integer")
-                if (numeric_flags is None and mincount > 0) or (numeric_flags is not None and len(numeric_flags) < mincount):
-                    self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.mincount", f"Minimum number of {msg_key} flags: {mincount}")
-            if maxcount is not None:
-                try:
-                    maxcount = int(maxcount)
-                except TypeError:
-                    raise RuntimeError(f"Validator>{msg_key}>maxcount must be an integer")
-                if (numeric_flags is None and maxcount < 0) or (numeric_flags is not None and len(numeric_flags) > maxcount):
-                    if maxcount == 0:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.maxcount", f"{msg_key.capitalize()} flags are not applicable")
-                    else:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, f"{msg_key}.maxcount", f"Maximum number of {msg_key} flags: {maxcount}")
-
-    def _process_args(self):
-        command_level = self._expanded_commands_config
-        parameters_only_turned_on = False
-        arg_index = 0
-        while arg_index < len(self.args):
-            arg = self.args[arg_index]
-            arg_index += 1
+                yield ParseEvent(EVENT_ERROR, None, token, {'type': ERROR_RESPONSE_FILE, 'message': message, 'file': path})
 
+    def _iter_events(self, args, stats = None):
+        """args is an iterator as option values are taken from it directly"""
+        options_equivalency = self._options_equivalency
+        get_default_validator = self._get_default_validator
+        classify = classify_arg
+        if stats is not None:
+            classify = stats.timed(classify_arg, 'classification', 'tokens classified')
+            get_default_validator = stats.counted(get_default_validator, 'equivalence lookups')
+            stats.counters.setdefault('validator calls', 0)
+        command_level = self._commands_trie
+        command_path = list()
+        command_groups = list()
+        parameters_only_turned_on = False
+        for arg in args:
             if arg == '':
                 continue
 
-            self.non_commands.append(arg)
-            arg_type = get_arg_type(arg)
+            arg_type, prefix, key, value = classify(arg)
 
             if not parameters_only_turned_on and arg_type == 'parameters only separator':
                 parameters_only_turned_on = True
+                yield ParseEvent(EVENT_SEPARATOR, arg, None, None)
 
             elif parameters_only_turned_on:
-                try:
-                    self.parameters.append(int(arg))
-                except ValueError:
-                    try:
-                        self.parameters.append(float(arg))
-                    except ValueError:
-                        self.parameters.append(arg)
+                yield ParseEvent(EVENT_PARAMETER, arg, None, _get_parameter_value(arg))
 
             elif arg_type == 'numeric':
-                numeric_val = int(arg[1:])
-                if arg[0] == '-':
-                    if self.numeric is None:
-                        self.numeric = numeric_val
-                    else:
-                        if not isinstance(self.numeric, tuple):
-                            self.numeric = (self.numeric, )
-                        self.numeric += (numeric_val, )
-                else: # '+'
-                    if self.plusnumeric is None:
-                        self.plusnumeric = numeric_val
-                    else:
-                        if not isinstance(self.plusnumeric, tuple):
-                            self.plusnumeric = (self.plusnumeric, )
-                        self.plusnumeric += (numeric_val, )
+                yield ParseEvent(EVENT_NUMERIC if prefix == '-' else EVENT_PLUSNUMERIC, arg, None, value)
 
             elif arg_type in ('single letter', 'doubleminus option') or \
-                (arg_type == 'long option' and arg in self._options_equivalency):
-                validator = self._get_default_validator(arg)
-                if validator in (None, bool):
-                    self._add_option_equivalents(arg, True)
+                (arg_type == 'long option' and arg in options_equivalency):
+                validator = get_default_validator(arg)
+                if validator in FLAG_VALIDATORS:
+                    yield ParseEvent(EVENT_OPTION, arg, arg, True)
                 else:
-                    if arg_index >= len(self.args):
-                        equivalents_str = '/'.join(self._options_equivalency.get(arg, {}).get('equivalents', ()))
-                        self._add_error(self.ERROR_VALUE_NOT_FOUND, arg, f"No value got for '{equivalents_str}' - validator: {validator.__name__}")
-                        self._validate_and_add(arg, True, lambda x: x)
-                        continue
-                    next_arg = self.args[arg_index]
-                    arg_index += 1
-                    self._validate_and_add(arg, next_arg, validator)
+                    yield from self._iter_option_value_events(arg, arg, validator, args, stats)
 
             elif arg_type == 'option and value':
-                key, value = arg.split('=', 1)
-                validator = self._get_default_validator(key)
-                if validator in (None, bool):
-                    if validator == bool:
-                        self._add_error(self.ERROR_TYPE_VALIDATION, key, f"Bool option '{key}' got a value '{value}'")
-                    self._add_option_equivalents(key, value)
+                validator = get_default_validator(key)
+                if validator in FLAG_VALIDATORS:
+                    if validator is not None:
+                        option_kind = 'Bool' if validator == bool else 'Count'
+                        yield ParseEvent(EVENT_ERROR, arg, key, {'type': ERROR_TYPE_VALIDATION, 'message': f"{option_kind} option '{key}' got a value '{value}'"})
+                        arg = None
+                    yield ParseEvent(EVENT_OPTION, arg, key, True if validator == count else value)
                 else:
-                    self._validate_and_add(key, value, validator)
+                    yield from self._iter_validated_events(arg, key, value, validator, stats)
 
-            elif arg_type == 'long option' or (arg_type == 'potential letter and value' and self._get_default_validator(arg[0:2]) not in (None, bool)):
-                first_letter_validator = self._get_default_validator(arg[0:2])
-                if first_letter_validator not in (None, bool):
-                    self._validate_and_add(arg[0:2], arg[2:], first_letter_validator)
+            elif arg_type == 'long option' or (arg_type == 'potential letter and value' and get_default_validator(key) not in FLAG_VALIDATORS):
+                first_letter_validator = get_default_validator(key)
+                if first_letter_validator not in FLAG_VALIDATORS:
+                    yield from self._iter_validated_events(arg, key, value, first_letter_validator, stats)
                     continue
-                unpackable = '-' not in arg[1:]
+                unpackable = '-' not in value
                 if unpackable:
-                    unpacked = list()
-                    prefix = arg[0]
-                    for letter in arg[1:]:
-                        unpacked.append(f"{prefix}{letter}")
-                    validated_options = tuple(option for option in unpacked if self._get_default_validator(option) not in (None, bool))
+                    unpacked = tuple(f"{prefix}{letter}" for letter in arg[1:])
+                    validated_options = tuple(option for option in unpacked if get_default_validator(option) not in FLAG_VALIDATORS)
                     if len(validated_options) <= 1:
+                        # only the first event of an argument carries the argument itself
+                        event_arg = arg
                         for option in unpacked:
                             if option not in validated_options:
-                                self._add_option_equivalents(option, True)
+                                yield ParseEvent(EVENT_OPTION, event_arg, option, True)
+                                event_arg = None
                         if len(validated_options) == 1:
                             option = validated_options[0]
-                            validator = self._get_default_validator(option)
-                            if arg_index >= len(self.args):
-                                equivalents_str = '/'.join(self._options_equivalency.get(option, {}).get('equivalents', ()))
-                                self._add_error(self.ERROR_VALUE_NOT_FOUND, option, f"No value got for '{equivalents_str}' - validator: {validator.__name__}")
-                                self._validate_and_add(option, True, lambda x: x)
-                                continue
-                            next_arg = self.args[arg_index]
-                            arg_index += 1
-                            self._validate_and_add(option, next_arg, validator)
+                            yield from self._iter_option_value_events(event_arg, option, get_default_validator(option), args, stats)
                         continue
-                self._add_option_equivalents(arg, True)
+                yield ParseEvent(EVENT_OPTION, arg, arg, True)
 
             else:
                 # arg_type == 'param or command'
                 # or
-                # arg_type == 'potential letter and value' and self._get_default_validator(arg[0:2]) in (None, bool)
+                # arg_type == 'potential letter and value' and get_default_validator(key) in FLAG_VALIDATORS
                 if isinstance(command_level, dict) and arg in command_level:
-                    self.commands.append(arg)
-                    self.non_commands.pop()
-                    command_level = command_level[arg]
+                    command_group, command_level = command_level[arg]
+                    if isinstance(command_level, subcommands):
+                        command_level = command_level.get_trie()
+                    command_path.append(arg)
+                    command_groups.append(command_group)
+                    yield ParseEvent(EVENT_COMMAND, arg, command_group, None)
+                    if not isinstance(command_level, dict):
+                        yield ParseEvent(EVENT_COMMANDS_RESOLVED, None, tuple(command_path), self._get_to_execute(command_level))
                 else:
-                    try:
-                        self.parameters.append(int(arg))
-                    except ValueError:
-                        try:
-                            self.parameters.append(float(arg))
-                        except ValueError:
-                            self.parameters.append(arg)
-
-        self.commands = get_equivalent_commands(self.commands, self.commands_config)
-        self.parameters = tuple(self.parameters)
-        self.non_commands = tuple(self.non_commands)
+                    yield ParseEvent(EVENT_PARAMETER, arg, None, _get_parameter_value(arg))
 
         if isinstance(command_level, dict):
             if '' in command_level:
-                if is_non_stringlike_sequence(command_level['']):
-                    self.to_execute = tuple(command_level[''])
-                else:
-                    self.to_execute = command_level['']
+                yield ParseEvent(EVENT_COMMANDS_RESOLVED, None, tuple(command_path), self._get_to_execute(command_level))
             else:
-                self._add_error(self.ERROR_INCOMPLETE_COMMAND, self.commands, f"Incomplete command: '{' '.join(self.commands)}'")
+                # keyed by the first equivalent per level, all the equivalent strings can be too many to build
+                command = ' '.join(command_group[0] for command_group in command_groups)
+                yield ParseEvent(EVENT_ERROR, None, command, {'type': ERROR_INCOMPLETE_COMMAND, 'message': f"Incomplete command: '{command}'"})
+
+    def _iter_option_value_events(self, arg, option, validator, args, stats):
+        next_arg = next(args, None)
+        if next_arg is None:
+            equivalents_str = '/'.join(self._options_equivalency.get(option, {}).get('equivalents', ()))
+            yield ParseEvent(EVENT_ERROR, arg, option, {'type': ERROR_VALUE_NOT_FOUND, 'message': f"No value got for '{equivalents_str}' - validator: {validator.__name__}"})
+            yield ParseEvent(EVENT_OPTION, None, option, True)
         else:
-            if is_non_stringlike_sequence(command_level):
-                self.to_execute = tuple(command_level)
-            else:
-                self.to_execute = command_level
+            yield from self._iter_validated_events(arg, option, next_arg, validator, stats)
 
-    def _validate_and_add(self, option, value, validator):
+    def _iter_validated_events(self, arg, option, value, validator, stats):
+        if stats is not None:
+            stats.increment('validator calls')
         try:
             valid = validator(value)
         except Exception as e:
-            self._add_option_equivalents(option, value)
-            self._add_error(self.ERROR_TYPE_VALIDATION, option, f"Validation error while validating '{value}' for '{option}': {e}")
+            error = {'type': ERROR_TYPE_VALIDATION, 'message': f"Validation error while validating '{value}' for '{option}': {e}"}
         else:
-            self._add_option_equivalents(option, valid)
+            yield ParseEvent(EVENT_OPTION, arg, option, valid)
+            return
+        yield ParseEvent(EVENT_OPTION, arg, option, value)
+        yield ParseEvent(EVENT_ERROR, None, option, error)
+
+
+def _run_in_pool(pool, handlers, max_running, timeout, _args, kwargs):
+    """Submits at most max_running handlers at a time, returns the return values and whether any is still running
+
+    The timeout of a handler counts from when it starts running, not from when it is queued in the pool.
+    A timed out handler can't be stopped, it keeps its place among the max_running ones until it finishes.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    return_values = [None] * len(handlers)
+    # future: [index of the handler, deadline - None until it starts running]
+    pending = dict()
+    # timed out handlers still running in the pool
+    abandoned = set()
+    next_index = 0
+    while next_index < len(handlers) or len(pending) > 0:
+        while next_index < len(handlers) and len(pending) + len(abandoned) < max_running:
+            pending[pool.submit(humblecall, handlers[next_index], *_args, **kwargs)] = [next_index, None]
+            next_index += 1
+        wait_timeout = None
+        if timeout is not None and len(pending) > 0:
+            now = time.monotonic()
+            for future, entry in pending.items():
+                if entry[1] is None and (future.running() or future.done()):
+                    entry[1] = now + timeout
+            deadlines = [deadline for _, deadline in pending.values() if deadline is not None]
+            wait_timeout = max(0, min(deadlines) - now) if len(deadlines) > 0 else None
+            if len(deadlines) < len(pending):
+                # futures don't notify when they start running, so the queued ones are polled
+                wait_timeout = POOL_POLL_INTERVAL if wait_timeout is None else min(wait_timeout, POOL_POLL_INTERVAL)
+        done, _ = wait(pending.keys() | abandoned, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+        abandoned -= done
+        for future in done:
+            if future in pending:
+                index, _ = pending.pop(future)
+                try:
+                    return_values[index] = future.result()
+                except Exception as e:
+                    return_values[index] = e
+        now = time.monotonic()
+        for future, (index, deadline) in tuple(pending.items()):
+            if deadline is not None and deadline <= now:
+                del pending[future]
+                abandoned.add(future)
+                return_values[index] = TimeoutError(f"Handler {getattr(handlers[index], '__name__', handlers[index])} timed out after {timeout}s")
+    return tuple(return_values), len(abandoned) > 0
+
+async def _call_handler_async(handler, _args, kwargs):
+    return await _await_handler_result(humblecall(handler, *_args, **kwargs))
+
+async def _await_handler_result(value):
+    if inspect.isasyncgen(value):
+        return [item async for item in value]
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+def _iter_checked_args(cli_args_iterable):
+    for arg in cli_args_iterable:
+        if not isinstance(arg, str):
+            raise ValueError(f"cli_args must be a list of strings")
+        yield arg
+
+def _get_numeric_value(numerics):
+    if len(numerics) == 0:
+        return None
+    if len(numerics) == 1:
+        return numerics[0]
+    return tuple(numerics)
 
-    def _add_option_equivalents(self, option, value):
-        if option in self.options:
-            if not isinstance(self.options[option], tuple):
-                self.options[option] = (self.options[option], )
-            self.options[option] += (value, )
+def _get_parameter_value(arg):
+    if not arg.isdecimal() and numeric_prefix_re.match(arg) is None:
+        return arg
+    try:
+        return int(arg)
+    except ValueError:
+        try:
+            return float(arg)
+        except ValueError:
+            return arg
+
+def _copy_parameters(parameters):
+    if isinstance(parameters, tuple):
+        return parameters
+    # array.array or a NumPy array, slicing a NumPy array would give a view
+    return parameters.copy() if hasattr(parameters, 'copy') else parameters[:]
+
+def _get_typed_parameters(parameters, array_type):
+    """Array of the parameters if all of them are numbers, of floats if any of them is a float, otherwise a tuple
+
+    Ints mixed with floats are only turned into floats if they are exact as floats, the parameters stay a tuple otherwise.
+    """
+    value_types = set(map(type, parameters))
+    if len(parameters) == 0 or not value_types <= {int, float}:
+        return tuple(parameters)
+    is_float = float in value_types
+    if is_float and int in value_types and any(-FLOAT_EXACT_INT_LIMIT > value or value > FLOAT_EXACT_INT_LIMIT for value in parameters if type(value) is int):
+        return tuple(parameters)
+    try:
+        if array_type == 'numpy':
+            import numpy
+            return numpy.array(parameters, dtype=numpy.float64 if is_float else numpy.int64)
+        return array('d' if is_float else 'q', parameters)
+    except OverflowError:
+        # ints not fitting in 64 bits
+        return tuple(parameters)
+
+def _get_result_cache(result_cache):
+    if result_cache is None or result_cache is False:
+        return None
+    if result_cache is True:
+        return LRUCache(RESULT_CACHE_SIZE)
+    if not isinstance(result_cache, int) or result_cache < 1:
+        raise ValueError(f"result_cache must be True or a positive int, got this: {result_cache}")
+    return LRUCache(result_cache)
+
+def _get_response_file_mode(response_files):
+    if response_files is False or response_files is None:
+        return None
+    if response_files is True:
+        return 'quoted'
+    if response_files not in RESPONSE_FILE_MODES:
+        raise ValueError(f"response_files must be True, 'quoted' or 'nul', got this: {response_files}")
+    return response_files
+
+def _get_array_type(typed_parameters):
+    if typed_parameters is False or typed_parameters is None:
+        return None
+    if typed_parameters not in (True, 'array', 'numpy'):
+        raise ValueError(f"typed_parameters must be True, 'array' or 'numpy', got this: {typed_parameters}")
+    if typed_parameters == 'array':
+        return 'array'
+    try:
+        import numpy
+    except ImportError:
+        if typed_parameters == 'numpy':
+            raise
+        return 'array'
+    return 'numpy'
+
+
+_worker_spec = None
+
+def _init_parse_worker(spec):
+    global _worker_spec
+    _worker_spec = spec
+
+def _parse_chunk_in_worker(chunk):
+    return tuple(_worker_spec.parse(cli_args)._get_state() for cli_args in chunk)
+
+
+class QuickParse(object):
+
+    __slots__ = ('args', '_spec', 'commands', 'parameters', '_options', 'non_commands', '_errors', 'to_execute', 'numeric', 'plusnumeric', '_command_path', 'stats')
+
+    ERROR_TYPE_VALIDATION = ERROR_TYPE_VALIDATION
+    ERROR_VALUE_NOT_FOUND = ERROR_VALUE_NOT_FOUND
+    ERROR_INCOMPLETE_COMMAND = ERROR_INCOMPLETE_COMMAND
+    ERROR_QUOTING = ERROR_QUOTING
+    ERROR_RESPONSE_FILE = ERROR_RESPONSE_FILE
+
+    EVENT_COMMAND = EVENT_COMMAND
+    EVENT_COMMANDS_RESOLVED = EVENT_COMMANDS_RESOLVED
+    EVENT_OPTION = EVENT_OPTION
+    EVENT_PARAMETER = EVENT_PARAMETER
+    EVENT_NUMERIC = EVENT_NUMERIC
+    EVENT_PLUSNUMERIC = EVENT_PLUSNUMERIC
+    EVENT_SEPARATOR = EVENT_SEPARATOR
+    EVENT_ERROR = EVENT_ERROR
+
+    def __init__(self, commands_config = None, options_config = None, cli_args = None, profile = False, cache_dir = None, typed_parameters = False, response_files = False,
+            cache_key = None):
+        args = self._get_args(cli_args)
+        spec = ParserSpec(commands_config, options_config, profile, cache_dir, typed_parameters, response_files, cache_key=cache_key)
+        # the spec is not shared, so its stats with the config phases continue as the stats of the result
+        self._init_parse(spec, args, spec.stats)
+
+    @staticmethod
+    def compile(commands_config = None, options_config = None, profile = False, cache_dir = None, typed_parameters = False, response_files = False,
+            result_cache = None, uncached_options = (), cache_key = None):
+        return ParserSpec(commands_config, options_config, profile, cache_dir, typed_parameters, response_files, result_cache, uncached_options, cache_key)
+
+    @staticmethod
+    def iter_events(cli_args_iterable, commands_config = None, options_config = None, response_files = False):
+        return ParserSpec(commands_config, options_config, response_files=response_files).iter_events(cli_args_iterable)
+
+    @staticmethod
+    def parse_many(cli_args_iterable, commands_config = None, options_config = None, *, workers = None, chunksize = 256):
+        return ParserSpec(commands_config, options_config).parse_many(cli_args_iterable, workers=workers, chunksize=chunksize)
+
+    @staticmethod
+    def parse_string(line, commands_config = None, options_config = None, comments = False):
+        return ParserSpec(commands_config, options_config).parse_string(line, comments)
+
+    @classmethod
+    def _from_spec(cls, spec, cli_args):
+        parsed = cls.__new__(cls)
+        parsed._init_parse(spec, cls._get_args(cli_args), spec._new_stats())
+        return parsed
+
+    @classmethod
+    def _from_string(cls, spec, line, comments):
+        parsed = cls.__new__(cls)
+        tokenizer = LineTokenizer(line, comments)
+        # the arguments go to _process_args as they are split, args is set from what was split afterwards
+        parsed._init_parse(spec, (), spec._new_stats(), tokenizer)
+        parsed.args = tuple(tokenizer.tokens)
+        for position, token, message in tokenizer.errors:
+            # an unclosed quote can be followed by a trailing backslash in the same argument, the quote is the cause
+            parsed._errors.setdefault(token, {'type': ERROR_QUOTING, 'message': message, 'position': position})
+        return parsed
+
+    @staticmethod
+    def _get_args(cli_args):
+        if cli_args is None:
+            return tuple(sys.argv[1:])
+        if not isinstance(cli_args, Iterable):
+            raise ValueError(f"cli_args must be a list of strings")
+        args = tuple(cli_args)
+        if not all(isinstance(element, str) for element in args):
+            raise ValueError(f"cli_args must be a list of strings")
+        return args
+
+    @classmethod
+    def _from_state(cls, spec, state):
+        parsed = cls.__new__(cls)
+        parsed._spec = spec
+        for name, value in state.items():
+            setattr(parsed, name, value)
+        parsed.to_execute = spec._get_to_execute(spec._get_command_level(parsed._command_path))
+        return parsed
+
+    def _get_state(self):
+        """Results without the parts coming from the spec, to be sent to other processes"""
+        return {name: getattr(self, name) for name in self._STATE_ATTRIBUTES}
+
+    _STATE_ATTRIBUTES = ('args', 'commands', 'parameters', '_options', 'non_commands', '_errors', 'numeric', 'plusnumeric', '_command_path', 'stats')
+
+    @property
+    def commands_config(self):
+        return self._spec.commands_config
+
+    @property
+    def options_config(self):
+        return self._spec.options_config
+
+    @property
+    def _expanded_commands_config(self):
+        return self._spec._expanded_commands_config
+
+    @property
+    def _options_equivalency(self):
+        return self._spec._options_equivalency
+
+    @property
+    def options(self):
+        return OptionsView(self._options, self._spec._options_equivalency, self._spec._canonical_options)
+
+    @property
+    def errors(self):
+        return ErrorsView(self._errors, self._spec._canonical_options)
+
+    def _init_parse(self, spec, args, stats = None, tokenizer = None):
+        self.args = args
+        self._spec = spec
+        self.stats = stats
+        self.commands = list()
+        self.parameters = list()
+        self._options = dict()
+        self.non_commands = list()
+        self._errors = dict()
+        self.to_execute = None
+        self.numeric = None
+        self.plusnumeric = None
+        if tokenizer is not None:
+            run_timed(stats, 'parsing', lambda: self._process_args(tokenizer))
+            return
+        result_cache = spec._result_cache
+        if result_cache is None or not spec._is_result_cacheable(args):
+            run_timed(stats, 'parsing', self._process_args)
+            return
+        result = result_cache.get(args)
+        if result is not None:
+            if stats is not None:
+                stats.increment('result cache hits')
+            self._set_result(result)
+            return
+        run_timed(stats, 'parsing', self._process_args)
+        if spec._uncached_options.isdisjoint(self._options) and spec._uncached_options.isdisjoint(self._errors):
+            result_cache.put(args, self._get_result())
+
+    def _get_result(self):
+        # copied both when cached and when taken from the cache, as validate() and callers can change the results
+        return (self.commands, _copy_parameters(self.parameters), dict(self._options), self.non_commands,
+            {target: dict(error) for target, error in self._errors.items()}, self.to_execute, self.numeric, self.plusnumeric, self._command_path)
+
+    def _set_result(self, result):
+        self.commands, parameters, options, self.non_commands, errors, self.to_execute, self.numeric, self.plusnumeric, self._command_path = result
+        self.parameters = _copy_parameters(parameters)
+        self._options = dict(options)
+        self._errors = {target: dict(error) for target, error in errors.items()}
+
+    def execute(self, *_args, **kwargs):
+        kwargs.setdefault('quickparse', self)
+        return_values = list()
+        with get_timer(self.stats)('execution'):
+            if isinstance(self.to_execute, tuple):
+                for try_to_call in self.to_execute:
+                    return_values.append(humblecall(try_to_call, *_args, **kwargs))
+                return_values = tuple(return_values)
+            else:
+                return_values = humblecall(self.to_execute, *_args, **kwargs)
+        return return_values
+
+    def execute_in_pool(self, *_args, executor = 'thread', max_workers = None, timeout = None, **kwargs):
+        """Like execute but calls the handlers in a pool, executor is 'thread', 'process' or a concurrent.futures executor
+
+        At most max_workers handlers run at a time, the return values keep the order of the handlers.
+        A failing handler doesn't stop the other ones, its exception is returned in place of its return value,
+        a TimeoutError is returned for a handler not done within timeout seconds after it started running.
+        A timed out handler keeps taking one of the max_workers places until it finishes, so with more handlers
+        than max_workers a handler that never finishes makes the call wait forever for a place for the rest.
+        """
+        kwargs.setdefault('quickparse', self)
+        with get_timer(self.stats)('execution'):
+            return self._execute_in_pool(executor, max_workers, timeout, _args, kwargs)
+
+    def _execute_in_pool(self, executor, max_workers, timeout, _args, kwargs):
+        handlers = self.to_execute if isinstance(self.to_execute, tuple) else (self.to_execute, )
+        if isinstance(executor, str):
+            # imported here as it takes longer than importing the rest of the package
+            from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+            pool_classes = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+            if executor not in pool_classes:
+                raise ValueError(f"Executor must be 'thread', 'process' or a concurrent.futures executor, got this: {executor}")
+            pool = pool_classes[executor](max_workers=max_workers or len(handlers) or None)
         else:
-            self.options[option] = value
-        for eq_option in self._options_equivalency.get(option, {}).get('equivalents', ()):
-            self.options[eq_option] = self.options[option]
+            pool = executor
+        still_running = False
+        try:
+            return_values, still_running = _run_in_pool(pool, handlers, max_workers or len(handlers), timeout, _args, kwargs)
+        finally:
+            if pool is not executor:
+                # timed out handlers can't be stopped, they are left running instead of waiting for them
+                pool.shutdown(wait=not still_running)
+        if isinstance(self.to_execute, tuple):
+            return return_values
+        return return_values[0]
 
-    def _get_default_validator(self, option):
-        return self._options_equivalency.get(option, {}).get('validator', None)
+    async def execute_async(self, *_args, sequential = False, **kwargs):
+        """Like execute but awaits coroutines and collects async generators into lists
+
+        The handlers of a tuple run concurrently unless sequential is set, in which case each is awaited
+        before the next one is called. If a handler fails, the other ones still running are cancelled.
+        """
+        # imported here as it takes long and the caller has it imported already
+        import asyncio
+        kwargs.setdefault('quickparse', self)
+        with get_timer(self.stats)('execution'):
+            if not isinstance(self.to_execute, tuple):
+                return await _await_handler_result(humblecall(self.to_execute, *_args, **kwargs))
+            if sequential:
+                return_values = list()
+                for try_to_call in self.to_execute:
+                    return_values.append(await _await_handler_result(humblecall(try_to_call, *_args, **kwargs)))
+                return tuple(return_values)
+            tasks = list()
+            try:
+                # handlers are called in their tasks, so one failing when called cancels the other ones too
+                for try_to_call in self.to_execute:
+                    tasks.append(asyncio.ensure_future(_call_handler_async(try_to_call, _args, kwargs)))
+                return tuple(await asyncio.gather(*tasks))
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+    @property
+    def has_errors(self):
+        return len(self._errors) > 0
+
+    @property
+    def error_messages(self):
+        return set(error['message'] for error in self._errors.values())
+
+    def validate(self, validator):
+        with get_timer(self.stats)('validation'):
+            if not isinstance(validator, CompiledValidator) or validator.spec is not self._spec:
+                validator = CompiledValidator(self._spec, validator.validator if isinstance(validator, CompiledValidator) else validator)
+            validator.apply(self)
+
+    def _process_args(self, args = None):
+        canonical_options = self._spec._canonical_options
+        count_options = self._spec._count_options
+        stats = self.stats
+        options = self._options
+        command_groups = list()
+        # values of repeated options and numerics are collected in lists and turned into tuples at the end
+        repeated_options = dict()
+        numerics = list()
+        plusnumerics = list()
+        for event_type, arg, key, value in self._spec._iter_args_events(self.args if args is None else args, stats):
+            if arg is not None and event_type != EVENT_COMMAND:
+                self.non_commands.append(arg)
+            if event_type == EVENT_OPTION:
+                if stats is not None:
+                    stats.increment('equivalence lookups')
+                option = canonical_options.get(key, key)
+                if option in count_options:
+                    options[option] = options.get(option, 0) + 1
+                elif option in repeated_options:
+                    repeated_options[option].append(value)
+                elif option in options:
+                    repeated_options[option] = [options[option], value]
+                else:
+                    options[option] = value
+            elif event_type == EVENT_PARAMETER:
+                self.parameters.append(value)
+            elif event_type == EVENT_COMMAND:
+                self.commands.append(arg)
+                command_groups.append(key)
+            elif event_type == EVENT_NUMERIC:
+                numerics.append(value)
+            elif event_type == EVENT_PLUSNUMERIC:
+                plusnumerics.append(value)
+            elif event_type == EVENT_ERROR:
+                self._errors[canonical_options.get(key, key)] = value
+            elif event_type == EVENT_COMMANDS_RESOLVED:
+                self.to_execute = value
+
+        for option, values in repeated_options.items():
+            options[option] = tuple(values)
+        self.numeric = _get_numeric_value(numerics)
+        self.plusnumeric = _get_numeric_value(plusnumerics)
+        self._command_path = tuple(self.commands)
+        self.commands = CommandPath(command_groups)
+        if self._spec._array_type is not None:
+            self.parameters = _get_typed_parameters(self.parameters, self._spec._array_type)
+        else:
+            self.parameters = tuple(self.parameters)
+        self.non_commands = tuple(self.non_commands)
+        if stats is not None:
+            stats.report('classification')
 
     def _add_error(self, type, target, message):
-        equivalent_targets = self._options_equivalency.get(target, {}).get('equivalents', (target, ))
-        error_object = {'type': type, 'message': message}
-        for target in equivalent_targets:
-            self.errors[target] = error_object
+        self._errors[self._spec._canonical_options.get(target, target)] = {'type': type, 'message': message}
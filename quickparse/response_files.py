@@ -0,0 +1,141 @@
+import mmap
+import os
+import re
+import stat
+import sys
+
+
+RESPONSE_FILE_MODES = ('quoted', 'nul')
+# bytes read at a time from response files that can't be memory mapped, like pipes
+STREAM_CHUNK_SIZE = 65536
+
+# whitespace separates arguments, quotes group characters and a backslash escapes the next character anywhere,
+# an unterminated quote lasts until the end of the file
+quoted_arg_re = re.compile(rb'''(?:[^\s'"\\]+|\\[\s\S]?|'(?:[^'\\]+|\\[\s\S])*'?|"(?:[^"\\]+|\\[\s\S])*"?)+''')
+quoted_part_re = re.compile(r'''([^'"\\]+)|\\([\s\S])|(\\)|'((?:[^'\\]+|\\[\s\S])*)('?)|"((?:[^"\\]+|\\[\s\S])*)("?)''')
+escape_re = re.compile(r'\\([\s\S])')
+
+
+class ResponseFileExpander(object):
+    """Replaces each @file argument by the arguments read from the file as the arguments are iterated
+
+    Regular files are memory mapped and read lazily, other ones like pipes are read in chunks as the arguments are
+    iterated, @file arguments in them are expanded too.
+    An @file argument stays as it is if the file can't be opened. Problems don't stop the expanding, they are collected
+    in errors as (kind, file, position in the file, argument as written, message) where kind is 'quoting' or 'include'.
+    An argument with a quoting problem is taken as if the file had ended with the missing closing quote, or without
+    the trailing backslash, and an @file argument of a file that is already being read is left out.
+    """
+
+    __slots__ = ('args', 'mode', 'errors')
+
+    def __init__(self, args, mode = 'quoted'):
+        if mode not in RESPONSE_FILE_MODES:
+            raise ValueError(f"Response file mode must be one of {', '.join(RESPONSE_FILE_MODES)}, got this: {mode}")
+        self.args = args
+        self.mode = mode
+        self.errors = list()
+
+    def __iter__(self):
+        for arg in self.args:
+            if arg[:1] == '@' and len(arg) > 1:
+                yield from self._iter_response_file_args(arg, ())
+            else:
+                yield arg
+
+    def _iter_response_file_args(self, arg, open_files, including_path = None):
+        # opened as given, resolving /dev/fd/N of a process substitution would give a path that can't be opened
+        path = arg[1:]
+        try:
+            response_file = open(path, 'rb', buffering=0)
+        except OSError:
+            yield arg
+            return
+        with response_file:
+            file_stat = os.fstat(response_file.fileno())
+            file_id = (file_stat.st_dev, file_stat.st_ino)
+            if file_id in open_files:
+                self.errors.append(('include', including_path, None, arg, f"Response file includes itself: {path}"))
+                return
+            if stat.S_ISREG(file_stat.st_mode):
+                if file_stat.st_size == 0:
+                    return
+                with mmap.mmap(response_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    yield from self._iter_file_args((mapped, ), path, open_files + (file_id, ))
+            else:
+                # pipes and FIFOs have no size and can't be mapped, they are read as the data arrives
+                chunks = iter(lambda: response_file.read(STREAM_CHUNK_SIZE), b'')
+                yield from self._iter_file_args(chunks, path, open_files + (file_id, ))
+
+    def _iter_file_args(self, chunks, path, open_files):
+        tokens = _iter_nul_separated(chunks) if self.mode == 'nul' else self._iter_quoted(chunks, path)
+        for token in tokens:
+            if token[:1] == '@' and len(token) > 1:
+                yield from self._iter_response_file_args(token, open_files, path)
+            else:
+                yield token
+
+    def _iter_quoted(self, chunks, path):
+        encoding, errors = sys.getfilesystemencoding(), sys.getfilesystemencodeerrors()
+        buffer = b''
+        # position of the buffer in the file
+        position = 0
+        for chunk in chunks:
+            buffer = buffer + chunk if len(buffer) > 0 else chunk
+            end = 0
+            for match in quoted_arg_re.finditer(buffer):
+                if match.end() == len(buffer):
+                    # the argument can continue in the next chunk
+                    break
+                yield self._get_quoted_arg(match, position, path, encoding, errors)
+                end = match.end()
+            buffer = buffer[end:]
+            position += end
+        for match in quoted_arg_re.finditer(buffer):
+            yield self._get_quoted_arg(match, position, path, encoding, errors)
+
+    def _get_quoted_arg(self, match, position, path, encoding, errors):
+        token = match.group().decode(encoding, errors)
+        if '\\' in token or '"' in token or "'" in token:
+            token = self._unquote(token, position + match.start(), path)
+        return token
+
+    def _unquote(self, token, start, path):
+        parts = list()
+        for match in quoted_part_re.finditer(token):
+            unquoted, escaped, trailing_backslash, single_quoted, single_closing, double_quoted, double_closing = match.groups()
+            if unquoted is not None:
+                parts.append(unquoted)
+            elif escaped is not None:
+                parts.append(escaped)
+            elif trailing_backslash is not None:
+                self._add_quoting_error(path, start, token, match.start(), "No escaped character")
+            else:
+                quoted, closing = (single_quoted, single_closing) if single_quoted is not None else (double_quoted, double_closing)
+                # escapes are resolved in quotes too
+                parts.append(escape_re.sub(r'\1', quoted))
+                if closing == '':
+                    self._add_quoting_error(path, start, token, match.start(), "No closing quotation for the quote")
+        return ''.join(parts)
+
+    def _add_quoting_error(self, path, start, token, offset, problem):
+        # the position is counted in bytes of the file, the offset in characters of the decoded token
+        position = start + len(token[:offset].encode(sys.getfilesystemencoding(), sys.getfilesystemencodeerrors()))
+        self.errors.append(('quoting', path, position, token, f"{problem} at position {position} of {path}"))
+
+
+def _iter_nul_separated(chunks):
+    encoding, errors = sys.getfilesystemencoding(), sys.getfilesystemencodeerrors()
+    buffer = b''
+    for chunk in chunks:
+        buffer = buffer + chunk if len(buffer) > 0 else chunk
+        position = 0
+        end = buffer.find(b'\0')
+        while end != -1:
+            if end > position:
+                yield buffer[position:end].decode(encoding, errors)
+            position = end + 1
+            end = buffer.find(b'\0', position)
+        buffer = buffer[position:]
+    if len(buffer) > 0:
+        yield buffer.decode(encoding, errors)
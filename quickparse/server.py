@@ -0,0 +1,288 @@
+"""Resident server answering parse, validate and complete requests over a Unix domain socket
+
+The protocol is one JSON object per line in both directions, e.g.
+{"id": 1, "op": "parse", "args": ["branch", "-v"]} is answered with {"id": 1, "result": {...}}.
+Requests on a connection are answered in order, so they can be pipelined.
+
+Run with: python -m quickparse.server my.config.module --socket /path/to.sock --idle-timeout 600
+"""
+
+import importlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+from .quickparse import QuickParse, ParserSpec
+from .completion import Completer
+
+
+class ParseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Loads the configs from a module once and reloads them when the module's file changes"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config_module, commands_attr = 'commands_config', options_attr = 'options_config', idle_timeout = None, cache_dir = None):
+        self.socket_path = socket_path
+        self.commands_attr = commands_attr
+        self.options_attr = options_attr
+        self.idle_timeout = idle_timeout
+        self.cache_dir = cache_dir
+        self.last_activity = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self._stop_requested = False
+        self._config_module = importlib.import_module(config_module)
+        self._load_config()
+        _remove_stale_socket(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+    def server_bind(self):
+        # the socket is created with the umask applied, so it is never accessible to other users,
+        # the umask is process wide but only changed for the duration of the bind
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def serve(self, poll_interval = 0.5):
+        """Serves until stop() is called or no request came for idle_timeout seconds"""
+        self.timeout = poll_interval
+        try:
+            while not self._stop_requested:
+                self.handle_request()
+                if self.idle_timeout is not None and time.monotonic() - self.last_activity > self.idle_timeout:
+                    break
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self):
+        self._stop_requested = True
+
+    def _load_config(self):
+        module = self._config_module
+        self._config_mtime = _get_mtime(module.__file__)
+        spec = ParserSpec(getattr(module, self.commands_attr, None), getattr(module, self.options_attr, None), cache_dir=self.cache_dir, cache_key=module)
+        # swapped in one assignment so that threads answering requests see a consistent state
+        self._state = (spec, Completer(spec), dict())
+
+    def _get_state(self):
+        if _get_mtime(self._config_module.__file__) != self._config_mtime:
+            with self._reload_lock:
+                if _get_mtime(self._config_module.__file__) != self._config_mtime:
+                    self._config_module = importlib.reload(self._config_module)
+                    self._load_config()
+        return self._state
+
+    def answer(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError(f"Request must be a JSON object")
+            request_id = request.get('id')
+            response = {'id': request_id, 'result': self._dispatch(request)}
+        except Exception as e:
+            response = {'id': request_id, 'error': f"{type(e).__name__}: {e}"}
+        return (json.dumps(response, default=repr) + '\n').encode('utf-8')
+
+    def _dispatch(self, request):
+        spec, completer, validators = self._get_state()
+        op = request.get('op')
+        if op == 'parse':
+            return get_result_dict(spec.parse(request.get('args', ())))
+        if op == 'validate':
+            parsed = spec.parse(request.get('args', ()))
+            # compiled validators are kept until the configs are reloaded
+            validator_key = json.dumps(request.get('validator'), sort_keys=True)
+            if validator_key not in validators:
+                validators[validator_key] = spec.compile_validator(request.get('validator'))
+            parsed.validate(validators[validator_key])
+            return get_result_dict(parsed)
+        if op == 'complete':
+            completion = completer.complete(request.get('words', ()), request.get('cursor'))
+            return {'candidates': list(completion.candidates), 'value_hint': completion.value_hint}
+        raise ValueError(f"Unknown op: {op}")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            self.server.last_activity = time.monotonic()
+            if line.strip() == b'':
+                continue
+            self.wfile.write(self.server.answer(line))
+            self.server.last_activity = time.monotonic()
+
+
+class ParseClient(object):
+    """Connection to a ParseServer, requests can be sent ahead of reading their responses"""
+
+    def __init__(self, socket_path, timeout = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rwb')
+        self._next_id = 0
+
+    def send(self, op, **params):
+        request_id = self._next_id
+        self._next_id += 1
+        self._file.write((json.dumps({'id': request_id, 'op': op, **params}) + '\n').encode('utf-8'))
+        self._file.flush()
+        return request_id
+
+    def receive(self):
+        line = self._file.readline()
+        if line == b'':
+            raise ConnectionError(f"Server closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def request(self, op, **params):
+        self.send(op, **params)
+        return self.receive()
+
+    def pipeline(self, requests):
+        """Sends all (op, params) requests without waiting for the responses, returns the results in order"""
+        requests = tuple(requests)
+        # sending from another thread, as the server blocks once the responses fill the socket buffer
+        sender = threading.Thread(target=self._send_all, args=(requests, ), daemon=True)
+        sender.start()
+        try:
+            return [self.receive() for _ in requests]
+        finally:
+            sender.join()
+
+    def _send_all(self, requests):
+        try:
+            for op, params in requests:
+                self.send(op, **params)
+        except OSError:
+            # the receiving side gets the error
+            pass
+
+    def parse(self, args):
+        return self.request('parse', args=list(args))
+
+    def validate(self, args, validator):
+        return self.request('validate', args=list(args), validator=validator)
+
+    def complete(self, words, cursor = None):
+        return self.request('complete', words=list(words), cursor=cursor)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_result_dict(parsed):
+    """JSON serializable form of the results, options are keyed by their canonical (first) equivalent"""
+    return {
+        'args': list(parsed.args),
+        'commands': list(parsed._command_path),
+        'parameters': parsed.parameters.tolist() if hasattr(parsed.parameters, 'tolist') else list(parsed.parameters),
+        'options': dict(parsed._options),
+        'numeric': parsed.numeric,
+        'plusnumeric': parsed.plusnumeric,
+        'errors': {str(target): error for target, error in parsed._errors.items()},
+    }
+
+def get_default_socket_path(config_module):
+    """A socket path in $XDG_RUNTIME_DIR, or else in a directory of the user in the temp directory
+
+    The temp directory is shared, so the directory is created only accessible by the user, and RuntimeError is
+    raised if it exists but is not a directory of the user that only they can access.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', '')
+    if os.path.isabs(runtime_dir) and _is_private_dir(runtime_dir):
+        return os.path.join(runtime_dir, f"quickparse-{config_module}.sock")
+    socket_dir = os.path.join(tempfile.gettempdir(), f"quickparse-{os.getuid()}")
+    try:
+        os.mkdir(socket_dir, 0o700)
+    except FileExistsError:
+        pass
+    if not _is_private_dir(socket_dir):
+        raise RuntimeError(f"Socket directory is not a directory only the user can access: {socket_dir}")
+    return os.path.join(socket_dir, f"{config_module}.sock")
+
+def _is_private_dir(path):
+    """Whether path is a directory, not a symlink to one, owned by the user and closed to others"""
+    try:
+        dir_stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(dir_stat.st_mode) and dir_stat.st_uid == os.getuid() and dir_stat.st_mode & 0o077 == 0
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _remove_stale_socket(socket_path):
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"Not a socket, refusing to remove it: {socket_path}")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+    else:
+        raise RuntimeError(f"A server is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+OPTIONS_CONFIG = [
+    ('--socket', str),
+    ('--idle-timeout', float),
+    ('--cache-dir', str),
+    ('--commands-attr', str),
+    ('--options-attr', str),
+    ('-h', '--help'),
+]
+
+def main(cli_args = None):
+    parsed = QuickParse(options_config=OPTIONS_CONFIG, cli_args=cli_args)
+    if '-h' in parsed.options or len(parsed.parameters) != 1 or parsed.has_errors:
+        for message in sorted(parsed.error_messages):
+            print(message, file=sys.stderr)
+        print(__doc__.strip(), file=sys.stderr)
+        return 0 if '-h' in parsed.options else 2
+    config_module = str(parsed.parameters[0])
+    sys.path.insert(0, os.getcwd())
+    server = ParseServer(
+        parsed.options.get('--socket', get_default_socket_path(config_module)),
+        config_module,
+        commands_attr=parsed.options.get('--commands-attr', 'commands_config'),
+        options_attr=parsed.options.get('--options-attr', 'options_config'),
+        idle_timeout=parsed.options.get('--idle-timeout'),
+        cache_dir=parsed.options.get('--cache-dir'),
+    )
+    server.serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
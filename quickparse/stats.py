@@ -0,0 +1,80 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+
+class ParseStats(object):
+    """Wall times of the phases in seconds and counters, collected when profiling is turned on
+
+    The hook, if any, is called as hook(phase, seconds, stats) each time a phase finishes.
+    """
+
+    __slots__ = ('timings', 'counters', 'hook')
+
+    def __init__(self, hook = None):
+        self.timings = dict()
+        self.counters = dict()
+        self.hook = hook
+
+    def record(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+        if self.hook is not None:
+            self.hook(phase, seconds, self)
+
+    def report(self, phase):
+        """Passes the time accumulated by timed() wrappers to the hook"""
+        seconds = self.timings.setdefault(phase, 0.0)
+        if self.hook is not None:
+            self.hook(phase, seconds, self)
+
+    def increment(self, counter, amount = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timer(self, phase):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, perf_counter() - start)
+
+    def timed(self, func, phase, counter):
+        """Wraps func to add its run time to the phase without calling the hook, and to count its calls"""
+        timings = self.timings
+        counters = self.counters
+        timings.setdefault(phase, 0.0)
+        counters.setdefault(counter, 0)
+        def timed_func(*args):
+            start = perf_counter()
+            result = func(*args)
+            timings[phase] += perf_counter() - start
+            counters[counter] += 1
+            return result
+        return timed_func
+
+    def counted(self, func, counter):
+        counters = self.counters
+        counters.setdefault(counter, 0)
+        def counted_func(*args):
+            counters[counter] += 1
+            return func(*args)
+        return counted_func
+
+    def __repr__(self):
+        return f"ParseStats(timings={self.timings!r}, counters={self.counters!r})"
+
+
+def run_timed(stats, phase, func):
+    """Calls func, timing it as the phase if profiling is on"""
+    if stats is None:
+        return func()
+    with stats.timer(phase):
+        return func()
+
+def get_timer(stats):
+    """The timer of stats, or a timer doing nothing if profiling is off"""
+    if stats is None:
+        return _no_timer
+    return stats.timer
+
+def _no_timer(phase):
+    return nullcontext()
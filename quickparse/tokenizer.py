@@ -0,0 +1,74 @@
+import re
+
+
+# POSIX shell word splitting like shlex.split: whitespace separates words, a backslash escapes the next character,
+# single quotes take everything literally and in double quotes a backslash only escapes '"' and '\'
+word_pattern = r'''(?:[^ \t\r\n'"\\]+|\\[\s\S]?|'[^']*'?|"(?:[^"\\]|\\[\s\S])*"?)+'''
+word_re = re.compile(word_pattern)
+# a '#' starting a word comments out the rest of the line
+word_or_comment_re = re.compile(r'#[^\n]*|' + word_pattern)
+word_part_re = re.compile(r'''([^'"\\]+)|\\([\s\S])|(\\)|'([^']*)('?)|"((?:[^"\\]|\\[\s\S])*)("?)''')
+double_quoted_escape_re = re.compile(r'\\(["\\])')
+
+
+class LineTokenizer(object):
+    """Splits a command line string into arguments as they are iterated
+
+    The arguments are collected in tokens. Quoting problems don't stop the tokenizing, they are collected in errors
+    as (position in the line, argument as written, message), the argument is then taken as if the line had ended
+    with the missing closing quote, or without the trailing backslash.
+    """
+
+    __slots__ = ('line', 'comments', 'tokens', 'errors')
+
+    def __init__(self, line, comments = False):
+        if not isinstance(line, str):
+            raise ValueError(f"Command line string expected, got this: {line!r}")
+        self.line = line
+        self.comments = comments
+        self.tokens = list()
+        self.errors = list()
+
+    def __iter__(self):
+        comments = self.comments
+        tokens = self.tokens
+        for match in (word_or_comment_re if comments else word_re).finditer(self.line):
+            token = match.group()
+            if comments and token[0] == '#':
+                continue
+            if '\\' in token or '"' in token or "'" in token:
+                token = self._unquote(token, match.start())
+            tokens.append(token)
+            yield token
+
+    def _unquote(self, token, start):
+        parts = list()
+        for match in word_part_re.finditer(token):
+            unquoted, escaped, trailing_backslash, single_quoted, single_closing, double_quoted, double_closing = match.groups()
+            if unquoted is not None:
+                parts.append(unquoted)
+            elif escaped is not None:
+                parts.append(escaped)
+            elif trailing_backslash is not None:
+                self._add_error(start + match.start(), token, f"No escaped character at position {start + match.start()}")
+            elif single_quoted is not None:
+                parts.append(single_quoted)
+                if single_closing == '':
+                    self._add_error(start + match.start(), token, f"No closing quotation for the quote at position {start + match.start()}")
+            else:
+                parts.append(double_quoted_escape_re.sub(r'\1', double_quoted))
+                if double_closing == '':
+                    self._add_error(start + match.start(), token, f"No closing quotation for the quote at position {start + match.start()}")
+        return ''.join(parts)
+
+    def _add_error(self, position, token, message):
+        self.errors.append((position, token, message))
+
+
+def split_line(line, comments = False):
+    """The arguments of a command line string as a list, ValueError is raised for bad quoting"""
+    tokenizer = LineTokenizer(line, comments)
+    tokens = list(tokenizer)
+    if len(tokenizer.errors) > 0:
+        raise ValueError(tokenizer.errors[0][2])
+    return tokens
@@ -0,0 +1,177 @@
+from collections.abc import Iterable, Sequence
+
+
+class CompiledValidator(object):
+    """A validator dict normalized once for a ParserSpec
+
+    Option names are resolved to the ids of their equivalents groups, so checking options
+    of a parse result comes down to a few operations on bitsets.
+    """
+
+    def __init__(self, spec, validator):
+        if not isinstance(validator, dict):
+            raise RuntimeError(f"Validator must be a dict")
+        self.spec = spec
+        self.validator = validator
+        self._option_ids = spec._option_ids
+        self._parameters = None
+        self._options = None
+        self._numeric = None
+        self._plusnumeric = None
+        parameters_validator = validator.get('parameters', dict())
+        if len(parameters_validator) > 0:
+            self._parameters = _compile_counts(parameters_validator, 'parameter')
+        options_validator = validator.get('options', dict())
+        if len(options_validator) > 0:
+            self._options = self._compile_options(options_validator)
+        numeric_validator = validator.get('numeric', dict())
+        if len(numeric_validator) > 0:
+            self._numeric = _compile_counts(numeric_validator, 'numeric')
+        plusnumeric_validator = validator.get('plusnumeric', dict())
+        if len(plusnumeric_validator) > 0:
+            self._plusnumeric = _compile_counts(plusnumeric_validator, 'plusnumeric')
+
+    def apply(self, parsed):
+        if self._parameters is not None:
+            self._validate_parameters(parsed)
+        if self._options is not None:
+            self._validate_options(parsed)
+        if self._numeric is not None:
+            self._validate_numeric(parsed, parsed.numeric, 'numeric', self._numeric)
+        if self._plusnumeric is not None:
+            self._validate_numeric(parsed, parsed.plusnumeric, 'plusnumeric', self._plusnumeric)
+
+    def _compile_options(self, options_validator):
+        mandatory = _get_option_names(options_validator.get('mandatory'), 'mandatory')
+        if 'optional' in options_validator:
+            optional = options_validator['optional']
+            optional = _get_option_names(optional if optional is not None else tuple(), 'optional')
+        else:
+            optional = None
+        forbidden = _get_option_names(options_validator.get('forbidden'), 'forbidden')
+        mandatory_mask, mandatory_names = self._get_mask_and_names(mandatory or ())
+        if optional is not None:
+            optional_mask, optional_names = self._get_mask_and_names(optional)
+            allowed = (mandatory_mask | optional_mask, mandatory_names | optional_names)
+        else:
+            allowed = None
+        if forbidden is not None:
+            forbidden = self._get_mask_and_names(forbidden)
+        return (mandatory is not None, mandatory_mask, mandatory_names), allowed, forbidden
+
+    def _get_mask_and_names(self, options):
+        """Bitset of the configured options' groups and the set of names not in the options config"""
+        mask = 0
+        names = set()
+        for option in options:
+            option_id = self._option_ids.get(option)
+            if option_id is None:
+                names.add(option)
+            else:
+                mask |= 1 << option_id
+        return mask, frozenset(names)
+
+    def _validate_parameters(self, parsed):
+        count, mincount, maxcount = self._parameters
+        parameters_count = len(parsed.parameters)
+        if count is not None:
+            if parameters_count != count:
+                if count == 0:
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'parameters.count', f"No parameters expected")
+                else:
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'parameters.count', f"{count} parameters expected, got {parameters_count}")
+        else:
+            if mincount is not None and parameters_count < mincount:
+                parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'parameters.mincount', f"Minimum number of parameters: {mincount}")
+            if maxcount is not None and parameters_count > maxcount:
+                if maxcount == 0:
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'parameters.maxcount', f"No parameters expected")
+                else:
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'parameters.maxcount', f"Maximum number of parameters: {maxcount}")
+
+    def _validate_options(self, parsed):
+        (has_mandatory, mandatory_mask, mandatory_names), allowed, forbidden = self._options
+        present_mask = 0
+        present_names = set()
+        for option in parsed._options:
+            option_id = self._option_ids.get(option)
+            if option_id is None:
+                present_names.add(option)
+            else:
+                present_mask |= 1 << option_id
+        if has_mandatory:
+            missing_strs = self._get_group_strs(mandatory_mask & ~present_mask, mandatory_names - present_names)
+            if len(missing_strs) > 0:
+                parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'options.mandatory', f"Mandatory options missing: {', '.join(missing_strs)}")
+        if allowed is not None:
+            allowed_mask, allowed_names = allowed
+            forbidden_strs = self._get_group_strs(present_mask & ~allowed_mask, present_names - allowed_names)
+            if len(forbidden_strs) > 0:
+                parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'options.optional', f"Option not applicable: {', '.join(forbidden_strs)}")
+        if forbidden is not None:
+            forbidden_mask, forbidden_names = forbidden
+            forbidden_strs = self._get_group_strs(present_mask & forbidden_mask, present_names & forbidden_names)
+            if len(forbidden_strs) > 0:
+                parsed._add_error(parsed.ERROR_TYPE_VALIDATION, 'options.forbidden', f"Option not applicable: {', '.join(forbidden_strs)}")
+
+    def _get_group_strs(self, mask, names):
+        group_strs = list()
+        while mask:
+            lowest_bit = mask & -mask
+            canonical = self.spec._canonical_option_list[lowest_bit.bit_length() - 1]
+            group_strs.append('/'.join(sorted(self.spec._options_equivalency[canonical]['equivalents'])))
+            mask ^= lowest_bit
+        group_strs.extend(sorted(names))
+        return group_strs
+
+    @staticmethod
+    def _validate_numeric(parsed, numeric, msg_key, counts):
+        count, mincount, maxcount = counts
+        numeric_flags = numeric if isinstance(numeric, Sequence) else (numeric, ) if numeric is not None else None
+        if count is not None:
+            if numeric_flags is None:
+                if count != 0:
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"{count} {msg_key} flag{'s' if count > 0 else ''} expected")
+            else:
+                if len(numeric_flags) != count:
+                    if count == 0:
+                        parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"{msg_key.capitalize()} flags are not applicable")
+                    else:
+                        parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.count", f"Expected {count} {msg_key} flags, got {len(numeric_flags)}")
+        else:
+            if mincount is not None:
+                if (numeric_flags is None and mincount > 0) or (numeric_flags is not None and len(numeric_flags) < mincount):
+                    parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.mincount", f"Minimum number of {msg_key} flags: {mincount}")
+            if maxcount is not None:
+                if (numeric_flags is None and maxcount < 0) or (numeric_flags is not None and len(numeric_flags) > maxcount):
+                    if maxcount == 0:
+                        parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.maxcount", f"{msg_key.capitalize()} flags are not applicable")
+                    else:
+                        parsed._add_error(parsed.ERROR_TYPE_VALIDATION, f"{msg_key}.maxcount", f"Maximum number of {msg_key} flags: {maxcount}")
+
+
+def _compile_counts(counts_validator, msg_key):
+    count = _get_int(counts_validator, 'count', msg_key)
+    mincount = _get_int(counts_validator, 'mincount', msg_key)
+    maxcount = _get_int(counts_validator, 'maxcount', msg_key)
+    if count is not None and (mincount is not None or maxcount is not None):
+        raise RuntimeError(f"Validator>{msg_key}>count is mutually exclusive with mincount and maxcount")
+    return count, mincount, maxcount
+
+def _get_int(counts_validator, key, msg_key):
+    value = counts_validator.get(key)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RuntimeError(f"Validator>{msg_key}>{key} must be an integer")
+
+def _get_option_names(options, key):
+    if options is None:
+        return None
+    if isinstance(options, str):
+        options = (options, )
+    if not isinstance(options, Iterable) or not all(isinstance(option, str) for option in options):
+        raise RuntimeError(f"Validator>options>{key} must be a string or list of strings")
+    return tuple(options)
@@ -0,0 +1,129 @@
+from collections.abc import Mapping, Sequence
+from itertools import product
+
+
+class OptionsView(Mapping):
+    """Read-only mapping of options where every equivalent option name is a key
+
+    Values are stored once under the canonical (first configured) equivalent.
+    """
+
+    __slots__ = ('_values', '_options_equivalency', '_canonical_options')
+
+    def __init__(self, values, options_equivalency, canonical_options):
+        self._values = values
+        self._options_equivalency = options_equivalency
+        self._canonical_options = canonical_options
+
+    def __getitem__(self, option):
+        return self._values[self._canonical_options.get(option, option)]
+
+    def __contains__(self, option):
+        return self._canonical_options.get(option, option) in self._values
+
+    def __iter__(self):
+        for canonical in self._values:
+            if canonical in self._options_equivalency:
+                yield from self._options_equivalency[canonical]['equivalents']
+            else:
+                yield canonical
+
+    def __len__(self):
+        return sum(len(self._options_equivalency[canonical]['equivalents']) if canonical in self._options_equivalency else 1 \
+            for canonical in self._values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ErrorsView(Mapping):
+    """Read-only mapping of errors with one key per error, equivalent option names can be used for lookups"""
+
+    __slots__ = ('_errors', '_canonical_options')
+
+    def __init__(self, errors, canonical_options):
+        self._errors = errors
+        self._canonical_options = canonical_options
+
+    def __getitem__(self, target):
+        return self._errors[self._canonical_options.get(target, target)]
+
+    def __contains__(self, target):
+        return self._canonical_options.get(target, target) in self._errors
+
+    def __iter__(self):
+        return iter(self._errors)
+
+    def __len__(self):
+        return len(self._errors)
+
+    def __repr__(self):
+        return repr(self._errors)
+
+
+class CommandPath(Sequence):
+    """Equivalent space separated command strings of a command path, e.g. ('branch mv', 'br mv', 'branch move', 'br move')
+
+    Only the alias groups per level are stored: membership tests split the string and check each level,
+    the strings are generated on iteration in the same order as a tuple of them would have.
+    The hash is that of the groups, a tuple of the strings compares equal but doesn't hash the same.
+    """
+
+    __slots__ = ('groups', )
+
+    def __init__(self, groups):
+        self.groups = tuple(groups)
+
+    @property
+    def path(self):
+        return tuple(group[0] for group in self.groups)
+
+    def __contains__(self, command):
+        if not isinstance(command, str):
+            return False
+        words = command.split(' ')
+        if len(words) != len(self.groups) or len(words) == 0:
+            return False
+        return all(word in group for word, group in zip(words, self.groups))
+
+    def __iter__(self):
+        if len(self.groups) == 0:
+            return
+        # the first level varies the fastest
+        for combination in product(*reversed(self.groups)):
+            yield ' '.join(reversed(combination))
+
+    def __len__(self):
+        if len(self.groups) == 0:
+            return 0
+        length = 1
+        for group in self.groups:
+            length *= len(group)
+        return length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("CommandPath index out of range")
+        words = list()
+        for group in self.groups:
+            index, word_index = divmod(index, len(group))
+            words.append(group[word_index])
+        return ' '.join(words)
+
+    def __eq__(self, other):
+        if isinstance(other, CommandPath):
+            return self.groups == other.groups
+        if isinstance(other, tuple):
+            return len(self) == len(other) and tuple(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.groups)
+
+    def __repr__(self):
+        return repr(tuple(self))
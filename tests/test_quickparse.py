@@ -1,6 +1,27 @@
+import asyncio
+import functools
+import gc
+import importlib
+import io
+import os
+import pickle
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from quickparse import QuickParse
+from quickparse import QuickParse, ParserSpec, CommandPath, CompiledValidator, ParseStats, Completer, handle_completion_request, get_completion_script, count, cacheable, lazy, subcommands, clear_validator_cache, validator_cache_info, clear_call_plan_cache, call_plan_cache_info
+from quickparse.lib import classify_arg, get_arg_type, humblecall, build_commands_trie, UNREFERENCEABLE_CALL_PLAN_CACHE_SIZE
+from quickparse.server import ParseServer, ParseClient, get_default_socket_path
+from quickparse.tokenizer import split_line
+from quickparse import response_files
+from quickparse.quickparse import RESULT_CACHE_SIZE
 
 
 func_names = \
@@ -21,9 +42,9 @@ def test_basics():
     assert tuple(parsed.args) == tuple(cli_args)
     assert parsed.commands_config is None
     assert parsed.options_config is None
-    assert isinstance(parsed.commands, (list, tuple))
+    assert isinstance(parsed.commands, (list, tuple, CommandPath))
     assert isinstance(parsed.parameters, (list, tuple))
-    assert isinstance(parsed.options, dict)
+    assert isinstance(parsed.options, Mapping)
     assert parsed.numeric == None
     assert parsed.plusnumeric == None
     assert parsed.to_execute == None
@@ -321,9 +342,9 @@ def test_basics_with_configs():
     assert parsed.commands_config == commands_config_ok
     assert isinstance(parsed.options_config, (list, tuple))
     assert parsed.options_config == options_config
-    assert isinstance(parsed.commands, (list, tuple))
+    assert isinstance(parsed.commands, (list, tuple, CommandPath))
     assert isinstance(parsed.parameters, (list, tuple))
-    assert isinstance(parsed.options, dict)
+    assert isinstance(parsed.options, Mapping)
     assert isinstance(parsed.non_commands, (list, tuple))
     assert callable(parsed.execute)
 
@@ -368,3 +389,693 @@ def test_non_commands():
     assert parsed.plusnumeric == None
     assert parsed.to_execute == user_add
     assert len(parsed.errors) == 0
+
+def test_compiled_spec():
+    spec = QuickParse.compile(commands_config_ok, options_config)
+    assert isinstance(spec, ParserSpec)
+    parsed = spec.parse('user add user1 -3 --long'.split())
+    assert isinstance(parsed, QuickParse)
+    assert tuple(parsed.commands) == ('user add', )
+    assert parsed.parameters == ('user1', )
+    assert parsed.options == {'-l': True, '--long': True}
+    assert parsed.numeric == 3
+    assert parsed.execute() == 'user_add'
+    parsed_again = spec.parse(['h'])
+    assert parsed_again.execute() == 'show_help'
+    assert parsed_again.options == dict()
+    assert parsed.commands_config is parsed_again.commands_config
+    with pytest.raises(ValueError):
+        QuickParse.compile({('help', 'h'): show_help, 'h': show_help})
+
+def test_classify_arg():
+    assert classify_arg('--') == ('parameters only separator', '--', None, None)
+    assert classify_arg('-12') == ('numeric', '-', None, 12)
+    assert classify_arg('+a') == ('single letter', '+', '+a', None)
+    assert classify_arg('--all') == ('doubleminus option', '--', '--all', None)
+    assert classify_arg('--name=a=b') == ('option and value', '--', '--name', 'a=b')
+    assert classify_arg('-abc') == ('long option', '-', '-a', 'bc')
+    assert classify_arg('-nFoo1') == ('potential letter and value', '-', '-n', 'Foo1')
+    assert classify_arg('-1a') == ('param or command', None, None, '-1a')
+    for arg in ('--', '-12', '+a', '--all', '-n=', '-abc', '-n1', 'x', '-', '---x'):
+        assert get_arg_type(arg) == classify_arg(arg)[0]
+
+def test_call_plan_cache():
+    def handler(value, quickparse):
+        return value
+    clear_call_plan_cache()
+    parsed = QuickParse(cli_args=[])
+    assert humblecall(handler, 'x', quickparse=parsed) == 'x'
+    assert call_plan_cache_info() == {'hits': 0, 'misses': 1, 'size': 1}
+    assert humblecall(handler, 'y', quickparse=parsed) == 'y'
+    assert call_plan_cache_info() == {'hits': 1, 'misses': 1, 'size': 1}
+    del handler
+    gc.collect()
+    assert call_plan_cache_info()['size'] == 0
+    humblecall(show_help)
+    clear_call_plan_cache()
+    assert call_plan_cache_info() == {'hits': 0, 'misses': 0, 'size': 0}
+    # instances that can't be weakly referenced share the plan of their class
+    class Handler(object):
+        __slots__ = ('value', )
+        def __init__(self, value):
+            self.value = value
+        def __call__(self, quickparse):
+            return self.value
+    assert [humblecall(Handler(index), quickparse=parsed) for index in range(1000)] == list(range(1000))
+    assert call_plan_cache_info() == {'hits': 999, 'misses': 1, 'size': 1}
+    del Handler
+    gc.collect()
+    assert call_plan_cache_info()['size'] == 0
+    # other ones are kept in a bounded cache
+    class PartialHandler(object):
+        __slots__ = ()
+        __call__ = functools.partial(lambda *args: args)
+    for index in range(UNREFERENCEABLE_CALL_PLAN_CACHE_SIZE + 10):
+        assert humblecall(PartialHandler(), index, quickparse=parsed) == (index, )
+    assert call_plan_cache_info()['size'] == UNREFERENCEABLE_CALL_PLAN_CACHE_SIZE
+    clear_call_plan_cache()
+
+def test_parse_many():
+    cli_args_list = [['h'], 'user add user1 -3 --long'.split(), ['branch'], ['branch', 'mv', 'x'], ['user'], []] * 5
+    spec = QuickParse.compile(commands_config_ok, options_config)
+    expected = [spec.parse(cli_args) for cli_args in cli_args_list]
+    for results in (spec.parse_many(cli_args_list), spec.parse_many(iter(cli_args_list), workers=2, chunksize=4)):
+        results = list(results)
+        assert len(results) == len(expected)
+        for parsed, expected_parsed in zip(results, expected):
+            assert parsed.args == expected_parsed.args
+            assert tuple(parsed.commands) == tuple(expected_parsed.commands)
+            assert parsed.parameters == expected_parsed.parameters
+            assert parsed.options == expected_parsed.options
+            assert parsed.errors == expected_parsed.errors
+            assert parsed.numeric == expected_parsed.numeric
+            assert parsed.to_execute == expected_parsed.to_execute
+    results = QuickParse.parse_many([['h']], commands_config_ok, workers=2)
+    assert [parsed.execute() for parsed in results] == ['show_help']
+
+def test_iter_events():
+    options_config = [
+        ('-n', '--name', str),
+        ('-l', '--long', bool),
+    ]
+    cli_args = iter('branch -n Foo mv file1 -2 -l=x 3'.split())
+    events = list(QuickParse.iter_events(cli_args, commands_config_ok, options_config))
+    assert events[:4] == [
+        (QuickParse.EVENT_COMMAND, 'branch', ('branch', 'br'), None),
+        (QuickParse.EVENT_OPTION, '-n', '-n', 'Foo'),
+        (QuickParse.EVENT_COMMAND, 'mv', ('move', 'mv'), None),
+        (QuickParse.EVENT_COMMANDS_RESOLVED, None, ('branch', 'mv'), branch_move),
+    ]
+    assert events[4:7] == [
+        (QuickParse.EVENT_PARAMETER, 'file1', None, 'file1'),
+        (QuickParse.EVENT_NUMERIC, '-2', None, 2),
+        (QuickParse.EVENT_ERROR, '-l=x', '-l', {'type': QuickParse.ERROR_TYPE_VALIDATION, 'message': "Bool option '-l' got a value 'x'"}),
+    ]
+    assert events[7:] == [
+        (QuickParse.EVENT_OPTION, None, '-l', 'x'),
+        (QuickParse.EVENT_PARAMETER, '3', None, 3),
+    ]
+    events = list(QuickParse.iter_events(arg for arg in ['user', 'ls']))
+    assert [event.type for event in events] == [QuickParse.EVENT_PARAMETER, QuickParse.EVENT_PARAMETER, QuickParse.EVENT_COMMANDS_RESOLVED]
+    assert events[-1].value is None
+    events = list(ParserSpec({'stage': {'drop': stage_drop}}).iter_events(['stage']))
+    assert [event.type for event in events] == [QuickParse.EVENT_COMMAND, QuickParse.EVENT_ERROR]
+    assert events[1].value['type'] == QuickParse.ERROR_INCOMPLETE_COMMAND
+    with pytest.raises(ValueError):
+        list(QuickParse.iter_events(['x', 1]))
+    parsed = QuickParse(commands_config_ok, cli_args=(arg for arg in ['user', 'add', 'x']))
+    assert parsed.args == ('user', 'add', 'x')
+    assert parsed.to_execute == user_add
+
+def test_options_and_errors_views():
+    options_config = [
+        ('-u', '--utc', '--universal'),
+        ('-x', '--extra', int),
+    ]
+    parsed = QuickParse(options_config=options_config, cli_args='--utc -x foo -a'.split())
+    assert not hasattr(parsed, '__dict__')
+    assert parsed._options == {'-u': True, '-x': 'foo', '-a': True}
+    assert parsed.options == {'-u': True, '--utc': True, '--universal': True, '-x': 'foo', '--extra': 'foo', '-a': True}
+    assert len(parsed.options) == 6
+    assert '--universal' in parsed.options and '-b' not in parsed.options
+    assert parsed.options.get('--extra') == 'foo'
+    with pytest.raises(TypeError):
+        parsed.options['-u'] = False
+    assert len(parsed.errors) == 1
+    assert tuple(parsed.errors) == ('-x', )
+    assert parsed.errors['--extra'] is parsed.errors['-x']
+    assert '--extra' in parsed.errors
+    assert parsed.error_messages == {"Validation error while validating 'foo' for '-x': invalid literal for int() with base 10: 'foo'"}
+
+def test_repeated_and_counted_options():
+    options_config = [
+        ('-I', '--include', str),
+        ('-v', '--verbose', count),
+    ]
+    cli_args = ['-I', 'a', '--include=b', '-Ic', '-vvv', '--verbose', '-1', '-2', '-3', '+4']
+    parsed = QuickParse(options_config=options_config, cli_args=cli_args)
+    assert parsed.options == {'-I': ('a', 'b', 'c'), '--include': ('a', 'b', 'c'), '-v': 4, '--verbose': 4}
+    assert parsed.numeric == (1, 2, 3)
+    assert parsed.plusnumeric == 4
+    assert len(parsed.errors) == 0
+    parsed = QuickParse(options_config=options_config, cli_args=['--verbose=2'])
+    assert parsed.options['-v'] == 1
+    assert parsed.error_messages == {"Count option '--verbose' got a value '2'"}
+    with pytest.raises(TypeError):
+        count('2')
+
+def test_command_path():
+    parsed = QuickParse(commands_config_ok, cli_args='br mv x'.split())
+    assert isinstance(parsed.commands, CommandPath)
+    assert parsed.commands.path == ('branch', 'move')
+    assert parsed.commands == ('branch move', 'br move', 'branch mv', 'br mv')
+    assert tuple(parsed.commands) == ('branch move', 'br move', 'branch mv', 'br mv')
+    assert len(parsed.commands) == 4
+    assert parsed.commands[1] == 'br move' and parsed.commands[-1] == 'br mv'
+    assert 'br move' in parsed.commands and 'branch' not in parsed.commands and 'br rm' not in parsed.commands
+    assert hash(parsed.commands) == hash(CommandPath(parsed.commands.groups))
+    groups = [('a', 'b', 'c', 'd')] * 5
+    deep = CommandPath(groups)
+    assert len(deep) == 1024
+    assert 'd c b a a' in deep
+    assert list(deep)[:3] == ['a a a a a', 'b a a a a', 'c a a a a']
+    assert all(deep[index] == command for index, command in enumerate(deep))
+    assert len(QuickParse(commands_config_ok, cli_args=[]).commands) == 0
+
+def test_incomplete_deep_command(monkeypatch):
+    def get_level(depth):
+        return show_help if depth == 0 else {tuple(f"c{depth}{alias}" for alias in range(6)): get_level(depth - 1)}
+    spec = QuickParse.compile({'top': get_level(9)})
+    def fail(self):
+        raise AssertionError('equivalent strings built')
+    # the path has 6 ** 8 equivalent strings, none of them should be built
+    monkeypatch.setattr(CommandPath, '__iter__', fail)
+    parsed = spec.parse(['top', 'c95', 'c84', 'c73', 'c62', 'c51', 'c40', 'c35', 'c24'])
+    command = 'top c90 c80 c70 c60 c50 c40 c30 c20'
+    assert parsed.errors == {command: {'type': QuickParse.ERROR_INCOMPLETE_COMMAND, 'message': f"Incomplete command: '{command}'"}}
+    assert hash(parsed.commands) == hash(parsed.commands)
+
+def test_commands_trie():
+    spec = ParserSpec(commands_config_ok)
+    trie = spec._commands_trie
+    assert trie['br'] is trie['branch']
+    assert trie['br'][0] == ('branch', 'br')
+    assert trie['br'][1]['del'] == (('delete', 'del'), branch_remove)
+    assert trie['user'][1][''] == (('', ), user_select)
+    assert spec._get_command_level(('br', 'mv')) == branch_move
+    assert spec._expanded_commands_config['branch']['delete'] == branch_remove
+    assert build_commands_trie(None) == {'': (('', ), None)}
+
+def test_compiled_validator():
+    options_config = [
+        ('-u', '--utc', '--universal'),
+        ('-l', '--long'),
+        ('-n', '--name', str),
+    ]
+    spec = QuickParse.compile(commands_config_ok, options_config)
+    validator = spec.compile_validator({
+        'parameters': {'maxcount': 1},
+        'options': {'mandatory': '--name', 'optional': ('-u', ), 'forbidden': '--long'},
+        'numeric': {'count': 0},
+    })
+    assert isinstance(validator, CompiledValidator)
+    parsed = spec.parse('user add x y --utc -l -a -3'.split())
+    parsed.validate(validator)
+    assert parsed.errors['parameters.maxcount']['message'] == "Maximum number of parameters: 1"
+    assert parsed.errors['options.mandatory']['message'] == "Mandatory options missing: --name/-n"
+    assert parsed.errors['options.optional']['message'] == "Option not applicable: --long/-l, -a"
+    assert parsed.errors['options.forbidden']['message'] == "Option not applicable: --long/-l"
+    assert parsed.errors['numeric.count']['message'] == "Numeric flags are not applicable"
+    parsed = spec.parse('user add x --universal --name=me'.split())
+    parsed.validate(validator)
+    assert len(parsed.errors) == 0
+    parsed = QuickParse(commands_config_ok, options_config, cli_args=['h', '-l'])
+    parsed.validate(validator)
+    assert tuple(parsed.errors) == ('options.mandatory', 'options.optional', 'options.forbidden')
+    with pytest.raises(RuntimeError):
+        spec.compile_validator({'parameters': {'count': 1, 'mincount': 0}})
+    with pytest.raises(RuntimeError):
+        parsed.validate(['-l'])
+
+def test_profiling():
+    commands_config = {'add': lambda: 'added'}
+    options_config = [('-n', '--num', int), ('-v', )]
+    parsed = QuickParse(commands_config, options_config, ['add', '-v', '--num', '3', 'x'])
+    assert parsed.stats is None
+    phases = list()
+    parsed = QuickParse(commands_config, options_config, ['add', '-v', '--num', '3', 'x'], profile=lambda phase, seconds, stats: phases.append(phase))
+    assert isinstance(parsed.stats, ParseStats)
+    assert parsed.stats.counters['tokens classified'] == 4
+    assert parsed.stats.counters['validator calls'] == 1
+    parsed.validate({'parameters': {'count': 1}})
+    assert parsed.execute() == 'added'
+    assert phases == ['config validation', 'commands trie', 'options equivalency', 'classification', 'parsing', 'validation', 'execution']
+    assert set(parsed.stats.timings) == set(phases)
+    assert all(seconds >= 0 for seconds in parsed.stats.timings.values())
+    spec = ParserSpec(commands_config, options_config, profile=True)
+    first, second = spec.parse(['add']), spec.parse(['add', 'x'])
+    assert first.stats is not second.stats
+    assert set(first.stats.timings) == {'classification', 'parsing'}
+    assert 'config validation' in spec.stats.timings
+
+def test_config_cache(tmp_path, monkeypatch):
+    commands_config = {('branch', 'br'): {'': show_help, ('list', 'ls'): show_help}}
+    options_config = [('-n', '--num', int), ('-c', count)]
+    spec = QuickParse.compile(commands_config, options_config, profile=True, cache_dir=tmp_path, cache_key='v1')
+    assert 'config validation' in spec.stats.timings
+    assert len(list(tmp_path.iterdir())) == 1
+    cached_spec = QuickParse.compile(commands_config, options_config, profile=True, cache_dir=tmp_path, cache_key='v1')
+    assert 'config validation' not in cached_spec.stats.timings
+    cli_args = ['br', 'ls', '-cc', '--num', '3']
+    parsed, cached_parsed = spec.parse(cli_args), cached_spec.parse(cli_args)
+    assert cached_parsed.commands == parsed.commands
+    assert cached_parsed.options == parsed.options == {'-n': 3, '--num': 3, '-c': 2}
+    assert cached_parsed.to_execute is show_help
+    # a new key gets its own cache file
+    QuickParse.compile(commands_config, options_config + [('-v', )], cache_dir=tmp_path, cache_key='v2')
+    assert len(list(tmp_path.iterdir())) == 2
+    # a corrupt cache file is recompiled and rewritten
+    for cache_file in tmp_path.iterdir():
+        cache_file.write_bytes(b'corrupt')
+    parsed = QuickParse(commands_config, options_config, cli_args, cache_dir=tmp_path, cache_key='v1')
+    assert parsed.options['-c'] == 2
+    # a cache file others can write is not loaded
+    for cache_file in tmp_path.iterdir():
+        cache_file.chmod(0o666)
+    assert 'config validation' in QuickParse.compile(commands_config, options_config, profile=True, cache_dir=tmp_path, cache_key='v1').stats.timings
+    # lambdas can't be pickled, the config is compiled every time
+    lambda_dir = tmp_path / 'lambdas'
+    parsed = QuickParse({'run': lambda: 'ran'}, cli_args=['run'], cache_dir=lambda_dir, cache_key='v1')
+    assert parsed.execute() == 'ran'
+    assert not lambda_dir.exists()
+    # a module as key is keyed by its file, so changing the file gets a new cache file
+    module_dir = tmp_path / 'modules'
+    module_dir.mkdir()
+    (module_dir / 'cached_config_module.py').write_text("options_config = [('-n', int)]\n")
+    monkeypatch.syspath_prepend(str(module_dir))
+    module = importlib.import_module('cached_config_module')
+    module_cache_dir = tmp_path / 'module_cache'
+    QuickParse.compile(None, module.options_config, cache_dir=module_cache_dir, cache_key=module)
+    QuickParse.compile(None, module.options_config, cache_dir=module_cache_dir, cache_key=module)
+    assert len(list(module_cache_dir.iterdir())) == 1
+    os.utime(module.__file__, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    QuickParse.compile(None, module.options_config, cache_dir=module_cache_dir, cache_key=module)
+    assert len(list(module_cache_dir.iterdir())) == 2
+    with pytest.raises(ValueError):
+        QuickParse.compile(commands_config, cache_dir=tmp_path)
+    with pytest.raises(ValueError):
+        QuickParse.compile(commands_config, cache_dir=tmp_path, cache_key=1)
+    with pytest.raises(ValueError):
+        QuickParse.compile({'1bad': None}, cache_dir=tmp_path, cache_key='bad')
+
+def test_completion():
+    commands_config = {('branch', 'br'): {'': show_help, ('list', 'ls'): show_help, 'add': show_help}, 'stash': show_help}
+    options_config = [('-n', '--num', int), ('-v', '--verbose')]
+    completer = Completer(QuickParse.compile(commands_config, options_config))
+    assert completer.complete([]).candidates == ('br', 'branch', 'stash')
+    assert completer.complete(['b']).candidates == ('br', 'branch')
+    assert completer.complete(['br', 'l']).candidates == ('list', 'ls')
+    assert completer.complete(['br'], cursor=1).candidates == ('add', 'list', 'ls')
+    assert completer.complete(['-v', 'br', '--']).candidates == ('--num', '--verbose')
+    assert completer.complete(['br', '--v']).candidates == ('--verbose', )
+    assert completer.complete(['br', '-']).candidates == ('--num', '--verbose', '-n', '-v')
+    assert completer.complete(['br', '--num', '']) == ((), 'int')
+    assert completer.complete(['br', '--num=4']) == ((), 'int')
+    assert completer.complete(['stash', '']).candidates == ()
+    assert completer.complete(['--', 'b']).candidates == ()
+    assert completer.complete(['br', 'ls'], cursor=0).candidates == ('br', 'branch')
+    with pytest.raises(ValueError):
+        completer.complete(['br'], cursor=2)
+    output = io.StringIO()
+    assert handle_completion_request(completer.spec, ['br', 'a'], {}, output) is False
+    assert handle_completion_request(completer.spec, ['br', 'a'], {'QUICKPARSE_COMPLETE': '1'}, output) is True
+    assert output.getvalue() == 'add\n'
+    for shell in ('bash', 'zsh', 'fish'):
+        assert 'QUICKPARSE_COMPLETE' in get_completion_script('my-cli', shell)
+    with pytest.raises(ValueError):
+        get_completion_script('my-cli', 'tcsh')
+
+def test_server(tmp_path, monkeypatch):
+    config_path = tmp_path / 'server_config.py'
+    config_path.write_text("commands_config = {('branch', 'br'): {'list': None, 'add': None}}\noptions_config = [('-n', '--num', int)]\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    socket_path = str(tmp_path / 'qp.sock')
+    server = ParseServer(socket_path, 'server_config', idle_timeout=5)
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    server_thread = threading.Thread(target=server.serve, kwargs={'poll_interval': 0.05})
+    server_thread.start()
+    try:
+        with ParseClient(socket_path, timeout=5) as client:
+            result = client.parse(['br', 'list', '--num', '3', 'x'])
+            assert result['commands'] == ['br', 'list']
+            assert result['options'] == {'-n': 3}
+            assert result['parameters'] == ['x']
+            result = client.validate(['br'], {'parameters': {'count': 1}})
+            assert set(result['errors']) == {'branch', 'parameters.count'}
+            assert client.complete(['br', 'l']) == {'candidates': ['list'], 'value_hint': None}
+            results = client.pipeline([('parse', {'args': ['br', 'add']}), ('complete', {'words': ['--n']}), ('parse', {'args': ['-n', '3']})])
+            assert [result.get('commands', result.get('candidates')) for result in results] == [['br', 'add'], ['--num'], []]
+            with pytest.raises(RuntimeError):
+                client.request('unknown')
+            # the configs are reloaded when the module changes
+            config_path.write_text("commands_config = {('branch', 'br'): {'list': None, 'remove': None}}\noptions_config = [('-n', '--num', int), ('-v', )]\n")
+            os.utime(config_path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+            assert client.complete(['br', '']) == {'candidates': ['list', 'remove'], 'value_hint': None}
+    finally:
+        server.stop()
+        server_thread.join(5)
+    assert not server_thread.is_alive()
+    assert not os.path.exists(socket_path)
+    # a file that is not a socket is not removed
+    not_a_socket = tmp_path / 'notasocket.txt'
+    not_a_socket.write_text('data')
+    with pytest.raises(RuntimeError):
+        ParseServer(str(not_a_socket), 'server_config')
+    assert not_a_socket.read_text() == 'data'
+    # idle shutdown
+    server = ParseServer(socket_path, 'server_config', idle_timeout=0.1)
+    server_thread = threading.Thread(target=server.serve, kwargs={'poll_interval': 0.05})
+    server_thread.start()
+    server_thread.join(5)
+    assert not server_thread.is_alive()
+
+def test_default_socket_path(tmp_path, monkeypatch):
+    runtime_dir = tmp_path / 'runtime'
+    runtime_dir.mkdir(mode=0o700)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(runtime_dir))
+    assert get_default_socket_path('mytool.cli') == str(runtime_dir / 'quickparse-mytool.cli.sock')
+    # a shared temp directory gets a directory only the user can access
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    socket_dir = tmp_path / f"quickparse-{os.getuid()}"
+    assert get_default_socket_path('mytool.cli') == str(socket_dir / 'mytool.cli.sock')
+    assert os.stat(socket_dir).st_mode & 0o777 == 0o700
+    # one created by someone else, or that others can access, is not used
+    socket_dir.chmod(0o755)
+    with pytest.raises(RuntimeError):
+        get_default_socket_path('mytool.cli')
+    socket_dir.rmdir()
+    socket_dir.symlink_to(runtime_dir)
+    with pytest.raises(RuntimeError):
+        get_default_socket_path('mytool.cli')
+
+def test_execute_async():
+    events = list()
+    async def fetch(quickparse):
+        await asyncio.sleep(0.05)
+        events.append('fetch')
+        return quickparse.parameters
+    async def stream():
+        for index in range(3):
+            yield index
+    async def fail():
+        raise ValueError('failed')
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append('cancelled')
+            raise
+    async def short():
+        await asyncio.sleep(0.05)
+        events.append('short')
+    commands_config = {'run': (fetch, stream, show_help), 'single': fetch, 'fail': (slow, fail), 'slow': (slow, ), 'sync-fail': (short, fail_handler)}
+    async def run():
+        parsed = QuickParse(commands_config, cli_args=['run', 'x'])
+        assert await parsed.execute_async() == (('x', ), [0, 1, 2], 'show_help')
+        assert await parsed.execute_async(sequential=True) == (('x', ), [0, 1, 2], 'show_help')
+        assert await QuickParse(commands_config, cli_args=['single']).execute_async() == ()
+        with pytest.raises(ValueError):
+            await QuickParse(commands_config, cli_args=['fail']).execute_async()
+        await asyncio.sleep(0)
+        assert events.count('cancelled') == 1
+        task = asyncio.ensure_future(QuickParse(commands_config, cli_args=['slow']).execute_async())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert events.count('cancelled') == 2
+        # failing when called, before anything is awaited
+        with pytest.raises(ValueError):
+            await QuickParse(commands_config, cli_args=['sync-fail']).execute_async()
+        await asyncio.sleep(0.1)
+        assert 'short' not in events
+    asyncio.run(run())
+
+def sum_parameters(quickparse):
+    return sum(quickparse.parameters)
+
+def fail_handler():
+    raise ValueError('failed')
+
+def sleep_handler():
+    time.sleep(0.5)
+    return 'slept'
+
+def test_execute_in_pool():
+    commands_config = {'report': (sum_parameters, fail_handler, show_help), 'single': sum_parameters, 'slow': (sleep_handler, show_help)}
+    parsed = QuickParse(commands_config, cli_args=['report', '1', '2'])
+    for executor in ('thread', 'process'):
+        return_values = parsed.execute_in_pool(executor=executor, max_workers=2)
+        assert return_values[0] == 3 and return_values[2] == 'show_help'
+        assert isinstance(return_values[1], ValueError)
+    assert QuickParse(commands_config, cli_args=['single', '4']).execute_in_pool(executor='thread') == 4
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert parsed.execute_in_pool(executor=pool)[0] == 3
+    return_values = QuickParse(commands_config, cli_args=['slow']).execute_in_pool(executor='thread', timeout=0.1)
+    assert isinstance(return_values[0], TimeoutError) and return_values[1] == 'show_help'
+    # the handlers queued behind a hung one are not charged for the time they wait
+    queued_config = {'queued': (sleep_handler, show_help, fail_handler)}
+    return_values = QuickParse(queued_config, cli_args=['queued']).execute_in_pool(executor='thread', max_workers=1, timeout=0.2)
+    assert isinstance(return_values[0], TimeoutError) and return_values[1] == 'show_help' and isinstance(return_values[2], ValueError)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return_values = QuickParse(queued_config, cli_args=['queued']).execute_in_pool(executor=pool, timeout=0.2)
+    assert isinstance(return_values[0], TimeoutError) and return_values[1] == 'show_help' and isinstance(return_values[2], ValueError)
+    with pytest.raises(ValueError):
+        parsed.execute_in_pool(executor='fiber')
+    # execute forwards every keyword to the handlers, including the ones execute_in_pool takes
+    fetch_config = {'fetch': lambda timeout = 30, max_workers = 1: (timeout, max_workers)}
+    assert QuickParse(fetch_config, cli_args=['fetch']).execute(timeout=5, max_workers=2) == (5, 2)
+
+def test_cacheable_validator():
+    calls = list()
+    def resolve(value):
+        calls.append(value)
+        if value == 'nowhere':
+            raise ValueError('unknown host')
+        return value.upper()
+    options_config = [('-h', '--host', cacheable(resolve))]
+    clear_validator_cache()
+    spec = QuickParse.compile(options_config=options_config)
+    for _ in range(3):
+        assert spec.parse(['--host', 'example']).options['-h'] == 'EXAMPLE'
+        parsed = spec.parse(['-h', 'nowhere'])
+        assert parsed.error_messages == {"Validation error while validating 'nowhere' for '-h': unknown host"}
+    assert calls == ['example', 'nowhere']
+    assert validator_cache_info() == {'hits': 4, 'misses': 2, 'evictions': 0, 'size': 2, 'maxsize': 4096}
+    assert "validator: resolve" in spec.parse(['--host']).error_messages.pop()
+    clear_validator_cache(maxsize=1)
+    spec.parse(['--host', 'a', '--host', 'b', '--host', 'a'])
+    assert validator_cache_info() == {'hits': 0, 'misses': 3, 'evictions': 2, 'size': 1, 'maxsize': 1}
+    clear_validator_cache(maxsize=4096)
+
+def test_numeric_parameters():
+    cli_args = ['--', '12', '-3', ' 7 ', '1_000', '٣', '.5', '5.', '1e3', 'inf', '-NaN', 'file.txt', 'index', 'nano', '0x10', '1__0', '']
+    parameters = QuickParse(cli_args=cli_args).parameters
+    assert parameters[:9] == (12, -3, 7, 1000, 3, 0.5, 5.0, 1000.0, float('inf'))
+    assert parameters[9] != parameters[9]
+    assert parameters[10:] == ('file.txt', 'index', 'nano', '0x10', '1__0')
+
+def test_typed_parameters():
+    spec = QuickParse.compile(typed_parameters='array')
+    parameters = spec.parse(['1', '2', '3']).parameters
+    assert isinstance(parameters, array) and parameters.typecode == 'q' and list(parameters) == [1, 2, 3]
+    parameters = spec.parse(['1', '2.5']).parameters
+    assert parameters.typecode == 'd' and list(parameters) == [1.0, 2.5]
+    assert spec.parse(['9007199254740993', '1.5']).parameters == (9007199254740993, 1.5)
+    assert list(spec.parse([str(2 ** 53), '1.5']).parameters) == [2.0 ** 53, 1.5]
+    assert spec.parse(['1', 'x']).parameters == (1, 'x')
+    assert spec.parse([str(2 ** 70)]).parameters == (2 ** 70, )
+    assert spec.parse([]).parameters == ()
+    parsed = spec.parse(['1', '2'])
+    parsed.validate({'parameters': {'count': 2}})
+    assert not parsed.has_errors
+    assert QuickParse(cli_args=['1', '2'], typed_parameters=True).parameters[1] == 2
+    with pytest.raises(ValueError):
+        QuickParse.compile(typed_parameters='list')
+
+def test_typed_parameters_numpy():
+    numpy = pytest.importorskip('numpy')
+    parameters = QuickParse(cli_args=['1', '2', '3'], typed_parameters='numpy').parameters
+    assert isinstance(parameters, numpy.ndarray) and parameters.dtype == numpy.int64
+
+def test_response_files(tmp_path):
+    nested = tmp_path / 'nested.rsp'
+    nested.write_text('--name "from nested"\n')
+    response_file = tmp_path / 'args.rsp'
+    response_file.write_text(f"""-v 'a b' c\\ d "e \\"f\\"" '' @{nested}\n""")
+    (tmp_path / 'empty.rsp').write_text('')
+    options_config = [('-v', '--verbose'), ('-n', '--name', str)]
+    cli_args = ['first', f"@{response_file}", f"@{tmp_path / 'empty.rsp'}", f"@{tmp_path / 'missing.rsp'}", 'last']
+    parsed = QuickParse(options_config=options_config, cli_args=cli_args, response_files=True)
+    assert parsed.args == tuple(cli_args)
+    assert parsed.parameters == ('first', 'a b', 'c d', 'e "f"', f"@{tmp_path / 'missing.rsp'}", 'last')
+    assert parsed.options['-v'] is True and parsed.options['--name'] == 'from nested'
+    assert QuickParse(cli_args=[f"@{response_file}"]).parameters == (f"@{response_file}", )
+    nul_file = tmp_path / 'args.nul'
+    nul_file.write_bytes(b"a b\0'c'\0\0-v\0")
+    events = list(QuickParse.compile(options_config=options_config, response_files='nul').iter_events([f"@{nul_file}"]))
+    assert [event.arg for event in events] == ['a b', "'c'", '-v', None]
+    cycle = tmp_path / 'cycle.rsp'
+    cycle.write_text(f"x @{cycle}")
+    parsed = QuickParse(cli_args=[f"@{cycle}", 'y'], response_files=True)
+    assert parsed.parameters == ('x', 'y')
+    assert parsed.errors == {f"@{cycle}": {'type': QuickParse.ERROR_RESPONSE_FILE, 'message': f"Response file includes itself: {cycle}", 'file': str(cycle)}}
+    unclosed = tmp_path / 'unclosed.rsp'
+    unclosed.write_text('a "b c\\')
+    parsed = QuickParse.compile(response_files=True).parse([f"@{unclosed}"])
+    assert parsed.parameters == ('a', 'b c')
+    assert parsed.errors == {'"b c\\': {'type': QuickParse.ERROR_QUOTING, 'message': f"No closing quotation for the quote at position 2 of {unclosed}", 'position': 2, 'file': str(unclosed)}}
+    events = list(QuickParse.iter_events(['-v', f"@{unclosed}"], response_files=True))
+    assert [event.type for event in events][-1:] == [QuickParse.EVENT_ERROR] and events[-1].value['type'] == QuickParse.ERROR_QUOTING
+    with pytest.raises(ValueError):
+        QuickParse.compile(response_files='csv')
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs FIFOs')
+def test_response_files_from_pipes(tmp_path, monkeypatch):
+    # small chunks so that arguments and quotes span reads
+    monkeypatch.setattr(response_files, 'STREAM_CHUNK_SIZE', 3)
+    nested = tmp_path / 'nested.rsp'
+    nested.write_text('nested')
+    fifo = tmp_path / 'args.fifo'
+    def write_fifo(content):
+        os.mkfifo(fifo)
+        writer = threading.Thread(target=fifo.write_text, args=(content, ))
+        writer.start()
+        return writer
+    writer = write_fifo(f"""x  'a b' "c\\"d" @{nested} é "open""")
+    parsed = QuickParse(cli_args=[f"@{fifo}"], response_files=True)
+    writer.join()
+    assert parsed.parameters == ('x', 'a b', 'c"d', 'nested', 'é', 'open')
+    position = len(f"""x  'a b' "c\\"d" @{nested} é """.encode())
+    assert parsed.errors['"open'] == {'type': QuickParse.ERROR_QUOTING, 'message': f"No closing quotation for the quote at position {position} of {fifo}", 'position': position, 'file': str(fifo)}
+    fifo.unlink()
+    writer = write_fifo('a b\0\0c\0d')
+    events = list(QuickParse.iter_events([f"@{fifo}"], response_files='nul'))
+    writer.join()
+    assert [event.arg for event in events] == ['a b', 'c', 'd', None]
+    # process substitution passes a /dev/fd/N path
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'y "z w"')
+    os.close(write_fd)
+    try:
+        assert QuickParse(cli_args=[f"@/dev/fd/{read_fd}"], response_files=True).parameters == ('y', 'z w')
+    finally:
+        os.close(read_fd)
+
+def test_config_problems():
+    commands_config = {'add': show_help, 'sub': {'x': show_help, ('x', 'y'): show_help, '': {'z': show_help}}, 3: show_help}
+    options_config = [('-a', '--all'), ('-a', int, str), ('--ok', ), ('bad', 1)]
+    with pytest.raises(ValueError) as excinfo:
+        QuickParse.compile(commands_config, options_config)
+    problems = str(excinfo.value).splitlines()[1:]
+    assert len(problems) == 7
+    assert "Invalid key in commands config: 3" in problems
+    assert "Duplicate key in commands config under 'sub': x" in problems
+    assert "Option name found multiple times in options config: -a" in problems
+    with pytest.raises(ValueError, match='^Dict expected'):
+        QuickParse.compile(['add'])
+
+def test_lazy_handlers(tmp_path, monkeypatch):
+    (tmp_path / 'lazy_handlers_module.py').write_text("def run(quickparse):\n    return ('ran', quickparse.parameters)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'lazy_handlers_module', raising=False)
+    commands_config = {'run': lazy('lazy_handlers_module:run'), 'missing': lazy('lazy_handlers_module:missing')}
+    parsed = QuickParse(commands_config, cli_args=['run', 'x'])
+    assert isinstance(parsed.to_execute, lazy) and parsed.to_execute.path == 'lazy_handlers_module:run'
+    assert parsed.to_execute.__name__ == 'run' and not parsed.to_execute.is_resolved
+    assert 'lazy_handlers_module' not in sys.modules
+    assert parsed.execute() == ('ran', ('x', ))
+    assert 'lazy_handlers_module' in sys.modules
+    assert pickle.loads(pickle.dumps(parsed.to_execute)).path == 'lazy_handlers_module:run'
+    with pytest.raises(ImportError):
+        QuickParse(commands_config, cli_args=['missing']).execute()
+    with pytest.raises(ValueError):
+        lazy('lazy_handlers_module.run')
+
+def test_subcommands(tmp_path, monkeypatch):
+    (tmp_path / 'team_commands_module.py').write_text("def show(): return 'show'\ncommands_config = {'show': show, ('list', 'ls'): show}\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'team_commands_module', raising=False)
+    loads = list()
+    def load_user_commands():
+        loads.append('user')
+        return {'add': user_add, 'del': user_del}
+    commands_config = {'user': subcommands(load_user_commands), 'team': subcommands('team_commands_module:commands_config'), 'help': show_help}
+    spec = QuickParse.compile(commands_config)
+    assert spec.parse(['help']).to_execute is show_help
+    assert loads == [] and 'team_commands_module' not in sys.modules
+    assert spec.parse(['user', 'add']).to_execute is user_add
+    assert spec.parse(['user', 'del']).to_execute is user_del
+    assert loads == ['user']
+    assert spec.parse(['team', 'ls']).commands == ('team list', 'team ls')
+    assert Completer(spec).complete(['team', 'l']).candidates == ('list', 'ls')
+    # loaded again after unpickling
+    assert not pickle.loads(pickle.dumps(commands_config['team'])).is_loaded and commands_config['team'].is_loaded
+    spec = QuickParse.compile({'broken': subcommands(lambda: {'x!': show_help, 3: show_help})})
+    with pytest.raises(ValueError):
+        spec.parse(['broken', 'x'])
+    with pytest.raises(ValueError):
+        subcommands({'user': user_add})
+
+def test_result_cache():
+    calls = list()
+    def now(value):
+        calls.append(value)
+        return time.time()
+    options_config = [('-n', '--num', int), ('--now', now), ('-v', '--verbose')]
+    spec = QuickParse.compile(commands_config_ok, options_config, result_cache=2, uncached_options=['--now'])
+    first = spec.parse(['branch', 'add', '-n', '3', 'x'])
+    first.validate({'options': {'mandatory': '--verbose'}})
+    second = spec.parse(['branch', 'add', '-n', '3', 'x'])
+    assert spec.result_cache_info() == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1, 'maxsize': 2}
+    assert second.options['--num'] == 3 and second.parameters == ('x', ) and second.to_execute is branch_add
+    assert first.has_errors and not second.has_errors
+    second._options['-n'] = 4
+    assert spec.parse(['branch', 'add', '-n', '3', 'x']).options['-n'] == 3
+    spec.parse(['--now', 'a'])
+    spec.parse(['--now', 'a'])
+    assert calls == ['a', 'a'] and spec.result_cache_info()['size'] == 1
+    spec.parse(['-v'])
+    spec.parse(['-n', '1'])
+    assert spec.result_cache_info()['evictions'] == 1
+    spec.clear_result_cache()
+    assert spec.result_cache_info()['size'] == 0
+    assert pickle.loads(pickle.dumps(QuickParse.compile(result_cache=True))).result_cache_info()['maxsize'] == RESULT_CACHE_SIZE
+    assert QuickParse.compile().result_cache_info() is None
+    with pytest.raises(ValueError):
+        QuickParse.compile(options_config=options_config, result_cache=True, uncached_options=['--later'])
+    with pytest.raises(ValueError):
+        QuickParse.compile(result_cache=0)
+
+def test_parse_string():
+    options_config = [('-v', '--verbose'), ('-n', '--name', str)]
+    spec = QuickParse.compile(commands_config_ok, options_config)
+    parsed = spec.parse_string("""branch add -v --name "a \\"b\\" c" 'd e' f\\ g""")
+    assert parsed.args == ('branch', 'add', '-v', '--name', 'a "b" c', 'd e', 'f g')
+    assert parsed.to_execute is branch_add and parsed.options['-n'] == 'a "b" c' and parsed.parameters == ('d e', 'f g')
+    assert not parsed.has_errors
+    assert spec.parse_string('branch add x # y z', comments=True).parameters == ('x', )
+    assert spec.parse_string('branch add x#y # z', comments=True).parameters == ('x#y', )
+    assert spec.parse_string('branch add x # y').parameters == ('x', '#', 'y')
+    parsed = spec.parse_string("branch add 'open")
+    assert parsed.parameters == ('open', )
+    assert parsed.errors["'open"] == {'type': QuickParse.ERROR_QUOTING, 'message': 'No closing quotation for the quote at position 11', 'position': 11}
+    assert spec.parse_string('branch add x\\').errors['x\\']['position'] == 12
+    errors = QuickParse.parse_string('foo "bar baz\' x \\').errors
+    assert list(errors.values()) == [{'type': QuickParse.ERROR_QUOTING, 'message': 'No closing quotation for the quote at position 4', 'position': 4}]
+    for line in ("a 'b c' d", 'a"b"c \\\'x', '"\\a\\\\" \'\\\'', '  ', "''"):
+        assert split_line(line) == shlex.split(line)
+    with pytest.raises(ValueError):
+        split_line('"open')
+    assert QuickParse.parse_string('-vv 1', options_config=options_config).options['-v'] == (True, True)